@@ -0,0 +1,130 @@
+"""比较原有解析方式、默认解码器与 msgspec 解码器处理 `message::recv` 数据帧的耗时
+
+原有解析方式先由 `json` 解析整个数据帧，将每条消息校验为 `Message` 模型后再转换为事件
+
+运行方式: `python benchmarks/decoder.py [消息条数] [重复次数]`
+"""
+import sys
+import json
+import timeit
+from typing import Any, Dict, List
+
+from nonebot.compat import model_dump, type_validate_python
+
+from nonebot.adapters.red.api.model import Message
+from nonebot.adapters.red.classifier import classifier
+from nonebot.adapters.red.decoder import Decoder, MsgspecDecoder
+from nonebot.adapters.red.event import GroupMessageEvent, PrivateMessageEvent
+
+ROLE = {"roleId": "0", "name": "", "color": 0}
+
+
+def make_message(seq: int) -> Dict[str, Any]:
+    return {
+        "msgId": f"7300000000000{seq:06d}",
+        "msgRandom": "1",
+        "msgSeq": str(seq),
+        "cntSeq": "0",
+        "chatType": 2 if seq % 4 else 1,
+        "msgType": 2,
+        "subMsgType": 1,
+        "sendType": 0,
+        "senderUid": "u_sender",
+        "senderUin": "10001",
+        "peerUid": "20002",
+        "peerUin": "20002",
+        "channelId": "",
+        "guildId": "",
+        "guildCode": "0",
+        "fromUid": "0",
+        "fromAppid": "0",
+        "msgTime": "1700000000",
+        "msgMeta": "0x",
+        "sendStatus": 2,
+        "sendMemberName": "member",
+        "sendNickName": "nick",
+        "guildName": "",
+        "channelName": "",
+        "elements": [
+            {
+                "elementType": 1,
+                "elementId": "1",
+                "textElement": {"content": f"message {seq}", "atType": 0},
+            },
+            {
+                "elementType": 2,
+                "elementId": "2",
+                "picElement": {
+                    "fileName": "a.png",
+                    "fileSize": "1024",
+                    "md5HexStr": "0" * 32,
+                    "sourcePath": "/nonexistent/a.png",
+                    "picWidth": 64,
+                    "picHeight": 64,
+                },
+            },
+        ],
+        "records": [],
+        "emojiLikesList": [],
+        "commentCnt": "0",
+        "directMsgFlag": 0,
+        "directMsgMembers": [],
+        "peerName": "group",
+        "editable": False,
+        "avatarMeta": "",
+        "roleId": "0",
+        "timeStamp": "0",
+        "isImportMsg": False,
+        "atType": 0,
+        "roleType": 2,
+        "fromChannelRoleInfo": ROLE,
+        "fromGuildRoleInfo": ROLE,
+        "levelRoleInfo": ROLE,
+        "recallTime": "0",
+        "isOnlineMsg": True,
+        "generalFlags": "",
+        "clientSeq": "0",
+    }
+
+
+def legacy(frame: str) -> List[Any]:
+    events = []
+    for item in json.loads(frame)["payload"]:
+        message = type_validate_python(Message, item)
+        target = GroupMessageEvent if message.chatType == 2 else PrivateMessageEvent
+        events.append(target.convert(message))
+    return events
+
+
+def run(decoder: Decoder, frame: str) -> List[Any]:
+    frame_type, payload = decoder.decode(frame)
+    return [
+        decoder.to_event(item, classifier.classify(decoder.key(frame_type, item)))
+        for item in decoder.split(payload)
+    ]
+
+
+def main(count: int = 50, repeat: int = 200) -> None:
+    frame = json.dumps(
+        {"type": "message::recv", "payload": [make_message(i) for i in range(count)]}
+    )
+    default, compiled = Decoder(), MsgspecDecoder()
+    expected = [(model_dump(e), e.message) for e in legacy(frame)]
+    for decoder in (default, compiled):
+        actual = [(model_dump(e), e.message) for e in run(decoder, frame)]
+        assert expected == actual, f"{decoder.name} produced different events"
+    cases = [
+        ("legacy", lambda: legacy(frame)),
+        (default.name, lambda: run(default, frame)),
+        (compiled.name, lambda: run(compiled, frame)),
+    ]
+    for name, func in cases:
+        cost = min(timeit.repeat(func, number=repeat, repeat=3))
+        print(
+            f"{name:>8}: {cost / repeat * 1000:8.3f} ms/frame "
+            f"({cost / repeat / count * 1e6:8.2f} us/message)"
+        )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
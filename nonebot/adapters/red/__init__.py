@@ -4,7 +4,9 @@ from .adapter import Adapter as Adapter
 from .message import Message as Message
 from .event import MessageEvent as MessageEvent
 from .message import MessageSegment as MessageSegment
+from .classifier import register_event as register_event
 from .event import GroupMessageEvent as GroupMessageEvent
 from .event import PrivateMessageEvent as PrivateMessageEvent
+from .preprocess import register_preprocessor as register_preprocessor
 
 __version__ = "0.9.0"
@@ -1,11 +1,11 @@
 import json
+import time
 import asyncio
 from typing_extensions import override
-from typing import Any, List, Type, Union, Optional
+from typing import Any, Dict, List, Union, Optional
 
 from nonebot.utils import escape_tag
-from pydantic import ValidationError
-from nonebot.compat import type_validate_python
+from nonebot.compat import model_dump, type_validate_python
 from nonebot.drivers import Driver, Request, WebSocket, ForwardDriver
 from nonebot.exception import ActionFailed, NetworkError, WebSocketClosed
 
@@ -14,18 +14,18 @@ from nonebot.adapters import Adapter as BaseAdapter
 
 from .bot import Bot
 from .utils import log
-from .api.model import MsgType
+from .event import Event
+from .client import APIClient
+from .backfill import Backfill
 from .api.handle import HANDLERS
-from .api.model import Message as MessageModel
+from .classifier import classifier
+from .api.model import UploadResponse
+from .decoder import Decoder, get_decoder
 from .config import Config, BotInfo, get_config
-from .event import (
-    Event,
-    MemberAddEvent,
-    MemberMuteEvent,
-    GroupMessageEvent,
-    PrivateMessageEvent,
-    GroupNameUpdateEvent,
-)
+from .connection import Connection, ConnectionState
+from .dispatcher import ORDER_KEYS, EventDispatcher
+from .cache import SeenIndex, MediaCache, UploadCache
+from .shard import ShardLink, Supervisor, shard_index, shard_items
 
 
 class Adapter(BaseAdapter):
@@ -42,7 +42,47 @@ class Adapter(BaseAdapter):
                 log("SUCCESS", f"Auto detect {len(self._bots)} bots.")
             except ImportError:
                 log("ERROR", "Please install `PyYAML` to enable auto detect!")
+        self.decoder: Decoder = Decoder()
+        if self.red_config.red_decoder != Decoder.name:
+            try:
+                self.decoder = get_decoder(self.red_config.red_decoder)
+            except ImportError:
+                log(
+                    "ERROR",
+                    f"Please install `{self.red_config.red_decoder}` "
+                    "to enable this decoder!",
+                )
+        self.dispatcher = EventDispatcher(
+            self.red_config.red_dispatch_workers,
+            self.red_config.red_dispatch_queue_size,
+            self.red_config.red_dispatch_overflow,
+            ORDER_KEYS[self.red_config.red_dispatch_order],
+        )
+        self.upload_cache = UploadCache(
+            self.red_config.red_upload_cache_size,
+            self.red_config.red_upload_cache_ttl,
+            self.red_config.red_upload_cache_path,
+        )
+        self.media_cache = MediaCache(
+            self.red_config.red_media_cache_size,
+            self.red_config.red_media_cache_path,
+        )
+        self.seen = SeenIndex(
+            self.red_config.red_dedup_size,
+            self.red_config.red_dedup_ttl,
+            self.red_config.red_dedup_path,
+        )
+        self.backfill: Optional[Backfill] = None
+        if self.red_config.red_backfill:
+            self.backfill = Backfill(
+                self._put_backfilled,
+                self.red_config.red_backfill_concurrency,
+                self.red_config.red_backfill_limit,
+                self.red_config.red_backfill_window,
+            )
         self.tasks: List[asyncio.Task] = []  # 存储 ws 任务
+        self.shards: Union[Supervisor, ShardLink, None] = None  # 分片模式下的进程间通道
+        self.connections: Dict[str, Connection] = {}  # 以 host:port 为键的连接状态
         self.setup()
 
     @classmethod
@@ -71,18 +111,64 @@ class Adapter(BaseAdapter):
                 "No bots found in config! \n"
                 "Please check your config file and make sure it's correct.",
             )
-        for bot in self._bots:
+        bots = self._bots
+        if (count := self.red_config.red_shards) > 1:
+            index = shard_index()
+            if index is None:
+                self.shards = Supervisor(count, self._on_shard_message)
+                index = 0
+            else:
+                self.shards = ShardLink(self._on_shard_message)
+            await self.shards.start()
+            bots = shard_items(bots, index, count)
+            self.upload_cache.on_set = self._publish_upload
+            # 每个分片只记录自己的 bot 收到的消息，分别持久化
+            if path := self.seen.path:
+                self.seen.path = path.with_name(f"{path.stem}.{index}{path.suffix}")
+            log("INFO", f"Running shard {index} of {count} with {len(bots)} bots")
+        self.dispatcher.start()
+        self.upload_cache.load()
+        self.seen.load()
+        for bot in bots:
             self.tasks.append(asyncio.create_task(self._forward_ws(bot)))
 
     async def shutdown(self) -> None:
         for task in self.tasks:
             if not task.done():
                 task.cancel()
+        await self.dispatcher.stop()
+        # 上传缓存在分片之间同步，只由主进程写入持久化文件
+        if not isinstance(self.shards, ShardLink):
+            self.upload_cache.save()
+        self.seen.save()
+        if self.shards:
+            await self.shards.close()
+
+    def _publish_upload(self, host: str, key: str, resp: UploadResponse) -> None:
+        if self.shards:
+            self.shards.publish(
+                {"type": "upload", "host": host, "key": key, "resp": model_dump(resp)}
+            )
+
+    def _on_shard_message(self, message: Dict[str, Any]) -> None:
+        if message["type"] == "upload":
+            self.upload_cache.set(
+                message["host"],
+                message["key"],
+                type_validate_python(UploadResponse, message["resp"]),
+                notify=False,
+            )
 
     async def _forward_ws(self, bot_info: BotInfo) -> None:
         bot: Optional[Bot] = None
+        warmup: Optional[asyncio.Task] = None
+        config = self.red_config
         ws_url = f"ws://{bot_info.host}:{bot_info.port}/"
         req = Request("GET", ws_url, timeout=60.0)
+        client = APIClient(self, bot_info, config.red_api_concurrency)
+        conn = self.connections[f"{bot_info.host}:{bot_info.port}"] = Connection(
+            escape_tag(str(ws_url))
+        )
         while True:
             try:
                 async with self.websocket(req) as ws:
@@ -91,17 +177,30 @@ class Adapter(BaseAdapter):
                         f"WebSocket Connection to "
                         f"{escape_tag(str(ws_url))} established",
                     )
+                    conn.enter(ConnectionState.AUTHENTICATING)
                     connect_packet = {
                         "type": "meta::connect",
                         "payload": {"token": bot_info.token},
                     }
                     try:
                         await ws.send(json.dumps(connect_packet))
-                        connect_data = json.loads(await ws.receive())
+                        connect_data = json.loads(
+                            await asyncio.wait_for(
+                                ws.receive(), config.red_ping_timeout
+                            )
+                        )
 
                         self_id = connect_data["payload"]["authData"]["uin"]
-                        bot = Bot(self, self_id, bot_info)
+                        await client.open()
+                        bot = Bot(
+                            self, self_id, bot_info, client=client, connection=conn
+                        )
                         self.bot_connect(bot)
+                        conn.enter(ConnectionState.LIVE)
+                        if config.red_roster_warmup:
+                            warmup = asyncio.create_task(self._warmup(bot))
+                        if self.backfill:
+                            self.backfill.resume(bot)
                         log(
                             "INFO",
                             f"<y>Bot {escape_tag(self_id)}</y> connected, "
@@ -124,8 +223,16 @@ class Adapter(BaseAdapter):
                             e,
                         )
                     finally:
+                        if warmup and not warmup.done():
+                            warmup.cancel()
+                        warmup = None
                         if bot:
+                            if self.backfill:
+                                self.backfill.cancel(bot)
+                            bot.scheduler.close()
                             self.bot_disconnect(bot)
+                            bot = None
+                        await client.close()
             except Exception as e:
                 # 尝试重连
                 log(
@@ -136,95 +243,108 @@ class Adapter(BaseAdapter):
                     f"</bg #f8bbd0></r>",
                     e,
                 )
-                await asyncio.sleep(3)  # 重连间隔
+            # 重连间隔
+            conn.enter(ConnectionState.BACKING_OFF)
+            await asyncio.sleep(
+                conn.backoff(config.red_reconnect_delay, config.red_reconnect_max_delay)
+            )
+            conn.enter(ConnectionState.CONNECTING)
+
+    async def _put_backfilled(self, bot: Bot, event: Event) -> None:
+        msg_id = getattr(event, "msgId", None)
+        if msg_id and not self.seen.add(bot.self_id, msg_id):
+            return
+        await self.dispatcher.put(bot, event)
+
+    async def _warmup(self, bot: Bot) -> None:
+        try:
+            await asyncio.gather(bot.get_friends(), bot.get_groups())
+        except Exception as e:
+            log("WARNING", f"Failed to warm up roster of bot {bot.self_id}", e)
+        else:
+            log("DEBUG", f"Roster of bot {bot.self_id} warmed up")
+
+    async def _probe(self, bot: Bot, ws: WebSocket) -> None:
+        """连接空闲时确认连接仍然存活，超时或失败时抛出 `NetworkError`"""
+        try:
+            await asyncio.wait_for(
+                self._ping(bot, ws), self.red_config.red_ping_timeout
+            )
+        except Exception as e:
+            raise NetworkError("Liveness probe failed") from e
+
+    async def _ping(self, bot: Bot, ws: WebSocket) -> None:
+        # 驱动器提供 ping 并返回 pong 的等待对象时 (如 websockets)，直接探测该连接
+        ping = getattr(getattr(ws, "websocket", None), "ping", None)
+        if ping is not None and (pong := await ping()) is not None:
+            await pong
+            return
+        # 否则 (如 aiohttp) 以 HTTP 请求代替，只能确认 Chronocat 存活，
+        # 无法发现半开的 WebSocket 连接，由 `red_idle_timeout` 兜底；
+        # 只检查请求是否成功，不校验返回的资料
+        await bot.call_api("get_self_profile")
 
     async def _loop(self, bot: Bot, ws: WebSocket):
+        interval = self.red_config.red_ping_interval
+        idle_timeout = self.red_config.red_idle_timeout
+        received = time.monotonic()
         while True:
-            data = await ws.receive()
-            json_data = json.loads(data)
-            _event_type = json_data["type"]
-            if not json_data["payload"]:
-                log("WARNING", f"received empty event {_event_type}")
-                continue
-
-            def _handle_event(event_data: Any, target: Type[Event]):
+            if not interval:
+                data = await ws.receive()
+            else:
                 try:
-                    event = target.convert(event_data)
-                except Exception as e:
-                    log(
-                        "WARNING",
-                        f"Failed to parse event data: {event_data}",
-                        e,
-                    )
-                else:
-                    asyncio.create_task(bot.handle_event(event))
+                    data = await asyncio.wait_for(ws.receive(), interval)
+                except asyncio.TimeoutError:
+                    idle = time.monotonic() - received
+                    if idle_timeout and idle >= idle_timeout:
+                        raise NetworkError(f"No data received in {idle:.0f}s")
+                    await self._probe(bot, ws)
+                    continue
+            received = time.monotonic()
+            await self._handle_frame(bot, data)
 
-            def _handle_message(message: dict):
-                try:
-                    _data = type_validate_python(MessageModel, message)
-                except ValidationError as e:
-                    log(
-                        "WARNING",
-                        f"Failed to parse message data: {message}",
-                        e,
-                    )
-                    return
-                if _data.msgType == MsgType.system and _data.sendType == 3:
-                    if (
-                        _data.subMsgType == 8
-                        and _data.elements[0].elementType == 8
-                        and _data.elements[0].grayTipElement
-                        and _data.elements[0].grayTipElement.subElementType == 4
-                        and _data.elements[0].grayTipElement.groupElement
-                        and _data.elements[0].grayTipElement.groupElement.type == 1
-                    ):
-                        _handle_event(_data, MemberAddEvent)
-                    elif (
-                        _data.subMsgType == 8
-                        and _data.elements[0].elementType == 8
-                        and _data.elements[0].grayTipElement
-                        and _data.elements[0].grayTipElement.subElementType == 4
-                        and _data.elements[0].grayTipElement.groupElement
-                        and _data.elements[0].grayTipElement.groupElement.type == 8
-                    ):
-                        _handle_event(_data, MemberMuteEvent)
-                    elif (
-                        _data.subMsgType == 8
-                        and _data.elements[0].elementType == 8
-                        and _data.elements[0].grayTipElement
-                        and _data.elements[0].grayTipElement.subElementType == 4
-                        and _data.elements[0].grayTipElement.groupElement
-                        and _data.elements[0].grayTipElement.groupElement.type == 5
-                    ):
-                        _handle_event(_data, GroupNameUpdateEvent)
-                    elif (
-                        _data.subMsgType == 12
-                        and _data.elements[0].elementType == 8
-                        and _data.elements[0].grayTipElement
-                        and _data.elements[0].grayTipElement.subElementType == 12
-                        and _data.elements[0].grayTipElement.xmlElement
-                        and _data.elements[0].grayTipElement.xmlElement.busiType == "1"
-                        and _data.elements[0].grayTipElement.xmlElement.busiId
-                        == "10145"
-                    ):
-                        _handle_event(_data, MemberAddEvent)
-                    else:
-                        log("WARNING", f"received unsupported event: {message}")
-                        return
-                else:
-                    if _data.chatType == 1:
-                        _handle_event(_data, PrivateMessageEvent)
-                    elif _data.chatType == 2:
-                        _handle_event(_data, GroupMessageEvent)
-                    else:
-                        log("WARNING", f"received unsupported event: {message}")
-                        return
+    async def _handle_frame(self, bot: Bot, data: Union[str, bytes]) -> None:
+        _event_type, payload = self.decoder.decode(data)
+        if not payload:
+            log("WARNING", f"received empty event {_event_type}")
+            return
+        if _event_type == "message::recv":
+            for msg in self.decoder.split(payload):
+                await self._handle_item(bot, _event_type, msg)
+        else:
+            await self._handle_item(bot, _event_type, payload)
 
-            if _event_type == "message::recv":
-                for msg in json_data["payload"]:
-                    _handle_message(msg)
-            else:
-                _handle_event(json_data["payload"], Event)
+    async def _handle_item(self, bot: Bot, frame_type: str, item: Any) -> None:
+        decoder = self.decoder
+        try:
+            msg_id = decoder.msg_id(item) if frame_type == "message::recv" else None
+            key = decoder.key(frame_type, item)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            log(
+                "WARNING",
+                f"Failed to parse message data: {decoder.load(item)}",
+                e,
+            )
+            return
+        # 在校验之前去除重复推送的消息
+        if msg_id and not self.seen.add(bot.self_id, msg_id):
+            log("DEBUG", f"Drop duplicate message {escape_tag(msg_id)}")
+            return
+        if not (target := classifier.classify(key)):
+            log("WARNING", f"received unsupported event: {decoder.load(item)}")
+            return
+        try:
+            event = decoder.to_event(item, target)
+        except Exception as e:
+            log(
+                "WARNING",
+                f"Failed to parse event data: {decoder.load(item)}",
+                e,
+            )
+        else:
+            if self.backfill:
+                self.backfill.observe_event(bot, event)
+            await self.dispatcher.put(bot, event)
 
     @override
     async def _call_api(self, bot: Bot, api: str, **data: Any) -> Union[dict, bytes]:
@@ -232,18 +352,16 @@ class Adapter(BaseAdapter):
         if not (handler := HANDLERS.get(api)):
             raise NotImplementedError(f"API {api} not implemented")
         api, method, platform_data = handler(data)
-        # 采用 HTTP 请求的方式，需要构造一个 Request 对象
-        request = Request(
-            method=method,  # 请求方法
-            url=bot.info.api_base / api,  # 接口地址
-            headers={"Authorization": f"Bearer {bot.info.token}"},
-            content=json.dumps(platform_data),
-            data=platform_data,
-        )
+        if api == "upload":
+            resp = await bot.client.request(
+                method, api, files={"file": ("file", platform_data)}
+            )
+        else:
+            resp = await bot.client.request(method, api, json=platform_data)
         if api == "message/fetchRichMedia":
-            return (await self.request(request)).content  # type: ignore
+            return resp.content  # type: ignore
         # 发送请求，返回结果
-        return json.loads((await self.request(request)).content)  # type: ignore
+        return json.loads(resp.content)  # type: ignore
 
     @override
     async def request(self, setup: Request):
@@ -0,0 +1,193 @@
+import time
+import asyncio
+from collections import OrderedDict, deque
+from typing import (
+    TYPE_CHECKING,
+    Set,
+    Dict,
+    List,
+    Deque,
+    Tuple,
+    Union,
+    Callable,
+    Optional,
+    Awaitable,
+)
+
+from .utils import log
+from .api.model import ChatType
+from .event import Event, NoticeEvent, MessageEvent
+
+if TYPE_CHECKING:
+    from .bot import Bot
+
+# 每个聊天对象记住的最近消息序号数量
+SEEN_SIZE = 256
+# 最多跟踪的聊天对象数量
+MAX_PEERS = 4096
+
+PeerKey = Tuple[str, int, str]
+
+
+class _Peer:
+    __slots__ = ("last", "seen", "order", "at")
+
+    def __init__(self, seq: int) -> None:
+        self.last = seq
+        self.seen: Set[int] = {seq}
+        self.order: Deque[int] = deque([seq])
+        self.at = time.monotonic()
+
+    def mark(self, seq: int) -> bool:
+        """记录消息序号，已经记录过时返回 `False`"""
+        if seq in self.seen:
+            return False
+        self.seen.add(seq)
+        self.order.append(seq)
+        if len(self.order) > SEEN_SIZE:
+            self.seen.discard(self.order.popleft())
+        return True
+
+
+class Backfill:
+    """依据消息序号发现漏收的消息并由历史消息补齐
+
+    记录每个聊天对象最近收到的 `msgSeq`，实时收到的消息序号不连续时，
+    拉取缺口内的历史消息；重新连接后，拉取断线前一段时间内活跃的聊天对象的最新消息。
+    补齐的事件设置 `backfilled` 后经由正常的分发流程处理，机器人自己发送的消息会被跳过。
+
+    参数:
+        put: 分发事件的函数
+        concurrency: 同时进行的补齐数量上限
+        limit: 单次补齐的消息数量上限
+        window: 重新连接后检查在断线前多少秒内活跃的聊天对象
+    """
+
+    def __init__(
+        self,
+        put: Callable[["Bot", Event], Awaitable[None]],
+        concurrency: int,
+        limit: int,
+        window: float,
+    ) -> None:
+        self.put = put
+        self.concurrency = max(1, concurrency)
+        self.limit = max(1, limit)
+        self.window = window
+        self._peers: OrderedDict[PeerKey, _Peer] = OrderedDict()
+        self._tasks: Dict[str, Set[asyncio.Task]] = {}
+        self._limit: Optional[asyncio.Semaphore] = None
+
+    def observe(
+        self,
+        bot: "Bot",
+        chat_type: int,
+        peer: str,
+        seq: Union[int, str],
+        msg_id: Optional[str] = None,
+    ) -> None:
+        """记录收到或发送的消息，序号不连续时开始补齐缺口
+
+        参数:
+            bot: 收到消息的 bot
+            chat_type: 聊天类型
+            peer: 聊天对象 id
+            seq: 消息的 `msgSeq`
+            msg_id: 消息的 `msgId`，作为拉取缺口内历史消息的起点
+        """
+        seq = int(seq)
+        key = (bot.self_id, int(chat_type), str(peer))
+        if (state := self._peers.get(key)) is None:
+            self._peers[key] = _Peer(seq)
+            if len(self._peers) > MAX_PEERS:
+                self._peers.popitem(last=False)
+            return
+        self._peers.move_to_end(key)
+        state.at = time.monotonic()
+        if not state.mark(seq):
+            return
+        if seq > state.last + 1:
+            self._spawn(bot, key, state, state.last, seq, msg_id)
+        state.last = max(state.last, seq)
+
+    def observe_event(self, bot: "Bot", event: Event) -> None:
+        """记录实时收到的事件"""
+        if isinstance(event, (MessageEvent, NoticeEvent)):
+            self.observe(bot, event.chatType, event.scene, event.msgSeq, event.msgId)
+
+    def resume(self, bot: "Bot") -> None:
+        """重新连接后补齐断线期间活跃的聊天对象的消息"""
+        since = time.monotonic() - self.window
+        for key, state in list(self._peers.items()):
+            if key[0] == bot.self_id and state.at >= since:
+                self._spawn(bot, key, state, state.last, None, None)
+
+    def cancel(self, bot: "Bot") -> None:
+        """取消 bot 正在进行的补齐"""
+        for task in self._tasks.pop(bot.self_id, set()):
+            task.cancel()
+
+    def _spawn(
+        self,
+        bot: "Bot",
+        key: PeerKey,
+        state: _Peer,
+        floor: int,
+        ceiling: Optional[int],
+        offset: Optional[str],
+    ) -> None:
+        task = asyncio.create_task(self._fill(bot, key, state, floor, ceiling, offset))
+        tasks = self._tasks.setdefault(bot.self_id, set())
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def _fill(
+        self,
+        bot: "Bot",
+        key: PeerKey,
+        state: _Peer,
+        floor: int,
+        ceiling: Optional[int],
+        offset: Optional[str],
+    ) -> None:
+        if self._limit is None:
+            self._limit = asyncio.Semaphore(self.concurrency)
+        _, chat_type, peer = key
+        count = self.limit if ceiling is None else min(self.limit, ceiling - floor)
+        events: List[Event] = []
+        async with self._limit:
+            try:
+                async for event in bot.iter_history(
+                    ChatType(chat_type), peer, offset, count, min_seq=floor + 1
+                ):
+                    seq = int(event.msgSeq)  # type: ignore
+                    if ceiling is not None and seq >= ceiling:
+                        continue
+                    if seq in state.seen:
+                        continue
+                    events.append(event)
+                    if len(events) > self.limit:
+                        events.pop()
+                        log(
+                            "WARNING",
+                            f"Too many missing messages in {peer}, "
+                            f"only {self.limit} are backfilled",
+                        )
+                        break
+            except Exception as e:
+                log("WARNING", f"Failed to backfill messages in {peer}", e)
+                return
+        events.sort(key=lambda event: int(event.msgSeq))  # type: ignore
+        for event in events:
+            if not state.mark(int(event.msgSeq)):  # type: ignore
+                continue
+            state.last = max(state.last, int(event.msgSeq))  # type: ignore
+            if isinstance(event, MessageEvent) and bot.self_id in (
+                event.senderUin,
+                event.senderUid,
+            ):
+                continue
+            event.backfilled = True
+            await self.put(bot, event)
+        if events:
+            log("DEBUG", f"Backfilled {len(events)} messages in {peer}")
@@ -1,9 +1,22 @@
-import re
 import random
-from datetime import timedelta
+import asyncio
+from pathlib import Path
+from functools import partial
 from typing_extensions import override
-from typing import Any, List, Tuple, Union, Optional
-
+from datetime import datetime, timedelta
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Set,
+    List,
+    Tuple,
+    Union,
+    Iterable,
+    Optional,
+    AsyncGenerator,
+)
+
+from nonebot.utils import escape_tag
 from nonebot.message import handle_event
 from nonebot.compat import type_validate_python
 
@@ -11,122 +24,35 @@ from nonebot.adapters import Bot as BaseBot
 from nonebot.adapters import Adapter as BaseAdapter
 from nonebot.adapters import MessageSegment as BaseMessageSegment
 
-from .utils import log
+from .roster import Roster
 from .config import BotInfo
+from .client import APIClient
+from .coalesce import Coalescer
+from .api.handle import HANDLERS
+from .connection import Connection
 from .api.model import Group, Member
+from .preprocess import Preprocessor
+from .scheduler import SendScheduler
+from .utils import log, iter_json_array
 from .api.model import Message as MessageModel
+from .classifier import classifier, message_key
 from .event import Event, NoticeEvent, MessageEvent
 from .api.model import Profile, ChatType, UploadResponse
-from .message import Message, ForwardNode, MessageSegment, MediaMessageSegment
-
-
-def _check_reply(bot: "Bot", event: MessageEvent) -> None:
-    """检查消息中存在的回复，去除并赋值 `event.reply`, `event.to_me`。
-
-    参数:
-        bot: Bot 对象
-        event: MessageEvent 对象
-    """
-    try:
-        index = event.message.index("reply")
-    except ValueError:
-        return
-
-    msg_seg = event.message[index]
-
-    event.reply = msg_seg.data["_origin"]  # type: ignore
-
-    # ensure string comparation
-    if str(event.reply.senderUin) == str(bot.self_id) or str(
-        event.reply.senderUid
-    ) == str(bot.self_id):
-        event.to_me = True
-
-    del event.message[index]
-    if len(event.message) > index and event.message[index].type == "at":
-        del event.message[index]
-    if len(event.message) > index and event.message[index].type == "text":
-        event.message[index].data["text"] = event.message[index].data["text"].lstrip()
-        if not event.message[index].data["text"]:
-            del event.message[index]
-    if not event.message:
-        event.message.append(MessageSegment.text(""))
-
-
-def _check_to_me(bot: "Bot", event: MessageEvent) -> None:
-    """检查消息开头或结尾是否存在 @机器人，去除并赋值 `event.to_me`。
-
-    参数:
-        bot: Bot 对象
-        event: MessageEvent 对象
-    """
-    if not isinstance(event, MessageEvent):
-        return
-
-    # ensure message not empty
-    if not event.message:
-        event.message.append(MessageSegment.text(""))
-
-    if event.chatType == ChatType.FRIEND:
-        event.to_me = True
-    else:
+from .broadcast import BroadcastItem, BroadcastResult, iter_broadcast
+from .message import (
+    Message,
+    ForwardNode,
+    MessageSegment,
+    PreparedMessage,
+    MediaMessageSegment,
+    upload_all,
+)
 
-        def _is_at_me_seg(segment: MessageSegment) -> bool:
-            return segment.type == "at" and str(segment.data.get("user_id", "")) == str(
-                bot.self_id
-            )
-
-        # check the first segment
-        if _is_at_me_seg(event.message[0]):
-            event.to_me = True
-            event.message.pop(0)
-            if event.message and event.message[0].type == "text":
-                event.message[0].data["text"] = event.message[0].data["text"].lstrip()
-                if not event.message[0].data["text"]:
-                    del event.message[0]
-
-        if not event.to_me:
-            # check the last segment
-            i = -1
-            last_msg_seg = event.message[i]
-            if (
-                last_msg_seg.type == "text"
-                and not last_msg_seg.data["text"].strip()
-                and len(event.message) >= 2
-            ):
-                i -= 1
-                last_msg_seg = event.message[i]
-
-            if _is_at_me_seg(last_msg_seg):
-                event.to_me = True
-                del event.message[i:]
-
-        if not event.message:
-            event.message.append(MessageSegment.text(""))
-
-
-def _check_nickname(bot: "Bot", event: MessageEvent) -> None:
-    """检查消息开头是否存在昵称，去除并赋值 `event.to_me`。
-
-    参数:
-        bot: Bot 对象
-        event: MessageEvent 对象
-    """
-    first_msg_seg = event.message[0]
-    if first_msg_seg.type != "text":
-        return
-
-    nicknames = {re.escape(n) for n in bot.config.nickname}
-    if not nicknames:
-        return
+if TYPE_CHECKING:
+    from .adapter import Adapter
 
-    # check if the user is calling me with my nickname
-    nickname_regex = "|".join(nicknames)
-    first_text = first_msg_seg.data["text"]
-    if m := re.search(rf"^({nickname_regex})([\s,，]*|$)", first_text, re.IGNORECASE):
-        log("DEBUG", f"User is calling me {m[1]}")
-        event.to_me = True
-        first_msg_seg.data["text"] = first_text[m.end() :]
+# 未知群组成员上限时拉取的成员数量
+MAX_MEMBERS = 3000
 
 
 def get_peer_data(event: Event, **kwargs: Any) -> Tuple[int, str]:
@@ -142,19 +68,39 @@ class Bot(BaseBot):
 
     @override
     def __init__(
-        self, adapter: BaseAdapter, self_id: str, info: BotInfo, **kwargs: Any
+        self,
+        adapter: BaseAdapter,
+        self_id: str,
+        info: BotInfo,
+        client: Optional[APIClient] = None,
+        connection: Optional[Connection] = None,
+        **kwargs: Any,
     ):
         super().__init__(adapter, self_id)
-        self.adapter: BaseAdapter = adapter
+        self.adapter: Adapter = adapter  # type: ignore
         self.info: BotInfo = info
+        self.client: APIClient = client or APIClient(adapter, info)
+        self.connection: Optional[Connection] = connection
+        self.roster = Roster(self.adapter.red_config.red_roster_ttl)
+        self.preprocessor = Preprocessor(self_id, self.config.nickname)
+        config = self.adapter.red_config
+        self.coalescer = Coalescer(config.red_batch_window, config.red_batch_size)
+        self.scheduler = SendScheduler(
+            config.red_send_rate,
+            {
+                ChatType.FRIEND: config.red_send_friend_rate,
+                ChatType.GROUP: config.red_send_group_rate,
+            },
+            config.red_send_peer_rate,
+            config.red_send_burst,
+        )
         # 一些有关 Bot 的信息也可以在此定义和存储
 
     async def handle_event(self, event: Event):
+        self.roster.apply(event)
         # TODO: 检查事件是否有回复消息，调用平台 API 获取原始消息的消息内容
         if isinstance(event, MessageEvent):
-            _check_reply(self, event)
-            _check_to_me(self, event)
-            _check_nickname(self, event)
+            self.preprocessor(self, event)
 
         await handle_event(self, event)
 
@@ -162,36 +108,102 @@ class Bot(BaseBot):
         self,
         chat_type: ChatType,
         target: Union[int, str],
-        message: Union[str, Message, MessageSegment],
+        message: Union[str, Message, MessageSegment, PreparedMessage],
     ) -> MessageModel:
         """依据聊天类型与目标 id 发送消息
 
         参数:
             chat_type: 聊天类型，分为好友与群组
             target: 目标 id
-            message: 发送的消息
+            message: 发送的消息，可以是预先导出的消息
+        """
+        return await (await self.queue_message(chat_type, target, message))
+
+    async def queue_message(
+        self,
+        chat_type: ChatType,
+        target: Union[int, str],
+        message: Union[str, Message, MessageSegment, PreparedMessage],
+    ) -> "asyncio.Future[MessageModel]":
+        """将消息加入发送队列，加入后立即返回，等待返回的 Future 得到发送结果
+
+        消息的导出与上传随即开始，与排队同时进行；
+        同一聊天对象的消息按加入队列的顺序依次发送，发送速率受 `red_send_*` 配置限制
+
+        参数:
+            chat_type: 聊天类型，分为好友与群组
+            target: 目标 id
+            message: 发送的消息，可以是预先导出的消息
         """
-        message = Message(message)
-        if message.has("forward"):
-            forward = message["forward", 0]
-            return await self.send_fake_forward(
-                forward.data["nodes"],
-                chat_type,
-                target,
+        target = str(target)
+        if not isinstance(message, PreparedMessage):
+            message = Message(message)
+            if message.has("forward"):
+                nodes = message["forward", 0].data["nodes"]
+                return self.scheduler.submit(
+                    chat_type,
+                    target,
+                    lambda: self.send_fake_forward(nodes, chat_type, target),
+                )
+            message = PreparedMessage(
+                message, target if chat_type == ChatType.GROUP else None
             )
-        element_data = await message.export(self)
+        export = asyncio.ensure_future(message.export(self))
+
+        async def _send() -> MessageModel:
+            # 调用者取消时导出会被停止，此时不应打断发送队列
+            await asyncio.wait([export])
+            if export.cancelled():
+                raise RuntimeError("Message export cancelled")
+            return await self._send_elements(chat_type, target, export.result())
+
+        def _done(future: asyncio.Future) -> None:
+            # 消息未发送时停止导出
+            if not export.done():
+                export.cancel()
+            elif not export.cancelled():
+                export.exception()
+
+        future = self.scheduler.submit(chat_type, target, _send)
+        future.add_done_callback(_done)
+        return future
+
+    async def _send_elements(
+        self, chat_type: int, target: str, elements: List[dict]
+    ) -> MessageModel:
         resp = await self.call_api(
             "send_message",
             chat_type=chat_type,
-            target=str(target),
-            elements=element_data,
+            target=target,
+            elements=elements,
+        )
+        result = type_validate_python(MessageModel, resp)
+        if self.adapter.backfill:
+            # 自己发送的消息同样占用序号，记录后不会被视为漏收
+            self.adapter.backfill.observe(self, chat_type, target, result.msgSeq)
+        return result
+
+    def prepare(
+        self,
+        message: Union[str, Message, MessageSegment],
+        group: Union[int, str, None] = None,
+    ) -> PreparedMessage:
+        """预先导出消息，用于重复发送相同的消息
+
+        消息在第一次发送时导出并上传媒体，之后的发送直接使用导出的结果
+
+        参数:
+            message: 消息，不能为合并转发
+            group: 发送的目标群组，用于查找未指定名称的 at 的群名片
+        """
+        return PreparedMessage(
+            Message(message), str(group) if group is not None else None
         )
-        return type_validate_python(MessageModel, resp)
 
     async def send_friend_message(
         self,
         target: Union[int, str],
-        message: Union[str, Message, MessageSegment],
+        message: Union[str, Message, MessageSegment, PreparedMessage],
     ) -> MessageModel:
         """发送好友消息
 
@@ -204,7 +216,7 @@ class Bot(BaseBot):
     async def send_group_message(
         self,
         target: Union[int, str],
-        message: Union[str, Message, MessageSegment],
+        message: Union[str, Message, MessageSegment, PreparedMessage],
     ) -> MessageModel:
         """发送群组消息
 
@@ -214,58 +226,144 @@ class Bot(BaseBot):
         """
         return await self.send_message(ChatType.GROUP, target, message)
 
+    def iter_broadcast(
+        self,
+        targets: Iterable[Union[int, str]],
+        message: Union[str, Message, MessageSegment, PreparedMessage],
+        chat_type: ChatType = ChatType.GROUP,
+        concurrency: Optional[int] = None,
+        interval: Optional[float] = None,
+    ) -> AsyncGenerator[BroadcastItem, None]:
+        """向多个目标发送同一条消息，每个目标发送完成时返回其结果
+
+        消息只导出与上传一次；单个目标发送失败不会影响其他目标
+
+        参数:
+            targets: 目标 id
+            message: 发送的消息，不能为合并转发
+            chat_type: 聊天类型，默认为群组
+            concurrency: 同时进行的发送数量上限，默认为 `red_broadcast_concurrency`
+            interval: 相邻两次发送的最小间隔，单位为秒，默认为 `red_broadcast_interval`
+        """
+        if not isinstance(message, PreparedMessage):
+            message = self.prepare(message)
+        config = self.adapter.red_config
+        return iter_broadcast(
+            self,
+            chat_type,
+            targets,
+            message,
+            config.red_broadcast_concurrency if concurrency is None else concurrency,
+            config.red_broadcast_interval if interval is None else interval,
+        )
+
+    async def broadcast(
+        self,
+        targets: Iterable[Union[int, str]],
+        message: Union[str, Message, MessageSegment, PreparedMessage],
+        chat_type: ChatType = ChatType.GROUP,
+        concurrency: Optional[int] = None,
+        interval: Optional[float] = None,
+    ) -> BroadcastResult:
+        """向多个目标发送同一条消息，返回汇总的结果
+
+        需要获取发送进度时请使用 `iter_broadcast`
+
+        参数:
+            targets: 目标 id
+            message: 发送的消息，不能为合并转发
+            chat_type: 聊天类型，默认为群组
+            concurrency: 同时进行的发送数量上限，默认为 `red_broadcast_concurrency`
+            interval: 相邻两次发送的最小间隔，单位为秒，默认为 `red_broadcast_interval`
+        """
+        result = BroadcastResult()
+        async for item in self.iter_broadcast(
+            targets, message, chat_type, concurrency, interval
+        ):
+            if item.error is not None:
+                result.failed[item.target] = item.error
+            else:
+                result.sent[item.target] = item.result  # type: ignore
+        return result
+
     @override
     async def send(
         self,
         event: Event,
-        message: Union[str, Message, MessageSegment],
+        message: Union[str, Message, MessageSegment, PreparedMessage],
         **kwargs: Any,
     ) -> MessageModel:
         """依据收到的事件发送消息
 
         参数:
             event: 收到的事件
-            message: 发送的消息
+            message: 发送的消息，可以是预先导出的消息
         """
         chatType, peerUin = get_peer_data(event, **kwargs)
-        message = Message(message)
-        if message.has("forward"):
-            forward = message["forward", 0]
-            return await self.send_fake_forward(
-                forward.data["nodes"],
-                ChatType(chatType),
-                peerUin,
-            )
-        element_data = await message.export(self)
-        resp = await self.call_api(
-            "send_message",
-            chat_type=chatType,
-            target=peerUin,
-            elements=element_data,
-        )
-        return type_validate_python(MessageModel, resp)
+        return await self.send_message(ChatType(chatType), peerUin, message)
 
     async def get_self_profile(self) -> Profile:
         """获取登录账号自己的资料"""
         resp = await self.call_api("get_self_profile")
         return type_validate_python(Profile, resp)
 
-    async def get_friends(self) -> List[Profile]:
-        """获取登录账号所有好友的资料"""
+    async def _fetch_friends(self) -> List[Profile]:
         resp = await self.call_api("get_friends")
         return [type_validate_python(Profile, data) for data in resp]
 
-    async def get_groups(self) -> List[Group]:
-        """获取登录账号所有群组的资料"""
+    async def _fetch_groups(self) -> List[Group]:
         resp = await self.call_api("get_groups")
         return [type_validate_python(Group, data) for data in resp]
 
+    async def _fetch_members(self, group: int, size: int) -> List[Member]:
+        resp = await self.call_api("get_members", group=group, size=size)
+        return [type_validate_python(Member, data["detail"]) for data in resp]
+
+    async def get_friends(self, refresh: bool = False) -> List[Profile]:
+        """获取登录账号所有好友的资料
+
+        参数:
+            refresh: 是否忽略缓存重新获取
+        """
+        return await self.roster.get_friends(self._fetch_friends, refresh)
+
+    async def get_groups(self, refresh: bool = False) -> List[Group]:
+        """获取登录账号所有群组的资料
+
+        参数:
+            refresh: 是否忽略缓存重新获取
+        """
+        return await self.roster.get_groups(self._fetch_groups, refresh)
+
+    async def get_friend(
+        self, user_id: Union[int, str], refresh: bool = False
+    ) -> Optional[Profile]:
+        """获取指定好友的资料，不是好友时返回 `None`
+
+        参数:
+            user_id: 好友的 uin 或 uid
+            refresh: 是否忽略缓存重新获取
+        """
+        return await self.roster.get_friend(user_id, self._fetch_friends, refresh)
+
+    async def get_group(
+        self, group: Union[int, str], refresh: bool = False
+    ) -> Optional[Group]:
+        """获取指定群组的资料，未加入该群组时返回 `None`
+
+        参数:
+            group: 群号
+            refresh: 是否忽略缓存重新获取
+        """
+        return await self.roster.get_group(group, self._fetch_groups, refresh)
+
     async def mute_member(
         self, group: int, *members: int, duration: Union[int, timedelta] = 60
     ):
         """禁言群成员
 
         禁言时间会自动限制在 60s 至 30天内
+        短时间内对同一群组的相同操作会合并为批量请求，见 `red_batch_window`
 
         参数:
             group: 群号
@@ -275,18 +373,30 @@ class Bot(BaseBot):
         if isinstance(duration, timedelta):
             duration = int(duration.total_seconds())
         duration = max(60, min(2592000, duration))
-        await self.call_api(
-            "mute_member", group=group, members=list(members), duration=duration
+
+        async def _send(chunk: List[int]) -> None:
+            await self.call_api(
+                "mute_member", group=group, members=chunk, duration=duration
+            )
+
+        await self.coalescer.submit(
+            ("mute_member", str(group), duration), members, _send
         )
 
     async def unmute_member(self, group: int, *members: int):
         """解除群成员禁言
 
+        短时间内对同一群组的相同操作会合并为批量请求，见 `red_batch_window`
+
         参数:
             group: 群号
             *members: 禁言目标的 id
         """
-        await self.call_api("unmute_member", group=group, members=list(members))
+
+        async def _send(chunk: List[int]) -> None:
+            await self.call_api("unmute_member", group=group, members=chunk)
+
+        await self.coalescer.submit(("unmute_member", str(group)), members, _send)
 
     async def mute_everyone(self, group: int):
         """开启全体禁言
@@ -313,19 +423,28 @@ class Bot(BaseBot):
     ):
         """移除群成员
 
+        短时间内对同一群组的相同操作会合并为批量请求，见 `red_batch_window`
+
         参数:
             group: 群号
             *members: 要移除的群成员账号
             refuse_forever: 是否不再接受群成员的入群申请
             reason: 移除理由
         """
-        await self.call_api(
-            "kick",
-            group=group,
-            members=list(members),
-            refuse_forever=refuse_forever,
-            reason=reason,
+
+        async def _send(chunk: List[int]) -> None:
+            await self.call_api(
+                "kick",
+                group=group,
+                members=chunk,
+                refuse_forever=refuse_forever,
+                reason=reason,
+            )
+
+        await self.coalescer.submit(
+            ("kick", str(group), refuse_forever, reason), members, _send
         )
+        self.roster.invalidate(group)
 
     async def get_announcements(self, group: int) -> List[dict]:
         """拉取群公告
@@ -335,25 +454,88 @@ class Bot(BaseBot):
         """
         return await self.call_api("get_announcements", group=group)
 
-    async def get_members(self, group: int, size: int = 20) -> List[Member]:
+    async def get_members(
+        self, group: int, size: int = 20, refresh: bool = False
+    ) -> List[Member]:
         """获取指定群组内的成员资料
 
         参数:
             group: 群号
             size: 拉取多少个成员资料
+            refresh: 是否忽略缓存重新获取
         """
-        resp = await self.call_api("get_members", group=group, size=size)
-        return [type_validate_python(Member, data["detail"]) for data in resp]
 
-    async def fetch(self, ms: BaseMessageSegment):
+        return await self.roster.get_members(
+            group, size, partial(self._fetch_members, group), refresh
+        )
+
+    async def iter_members(
+        self, group: int, size: Optional[int] = None
+    ) -> AsyncGenerator[Member, None]:
+        """逐个获取指定群组内的成员资料
+
+        以流的形式读取 Chronocat 的响应，每解析出一个成员就立即返回，
+        不会将整个成员列表读入内存；缓存中已有足够的成员资料时直接使用缓存
+
+        参数:
+            group: 群号
+            size: 拉取多少个成员资料，默认为群组的成员上限
+        """
+        if size is None:
+            info = await self.get_group(group)
+            size = info.maxMember if info else MAX_MEMBERS
+        if (cached := self.roster.cached_members(group, size)) is not None:
+            for member in cached:
+                yield member
+            return
+        api, method, data = HANDLERS["get_members"]({"group": group, "size": size})
+        stream = self.client.stream(method, api, json=data)
+        items = iter_json_array(resp.content async for resp in stream)  # type: ignore
+        try:
+            async for item in items:
+                yield type_validate_python(Member, item["detail"])
+        finally:
+            await items.aclose()
+            await stream.aclose()
+
+    async def get_member(
+        self, group: int, user_id: Union[int, str], refresh: bool = False
+    ) -> Optional[Member]:
+        """获取群组内指定成员的资料，不在群组内时返回 `None`
+
+        参数:
+            group: 群号
+            user_id: 成员的 uin 或 uid
+            refresh: 是否忽略缓存重新获取
+        """
+        if not (info := await self.get_group(group)):
+            return None
+
+        return await self.roster.get_member(
+            group, user_id, info.maxMember, partial(self._fetch_members, group), refresh
+        )
+
+    async def fetch(self, ms: BaseMessageSegment, zero_copy: bool = False):
         """获取媒体消息段的二进制数据
 
         参数:
             ms: 消息段
+            zero_copy: 本机缓存文件是否以只读方式映射到内存，而不是复制文件内容
+        """
+        if not isinstance(ms, MediaMessageSegment):
+            raise ValueError(f"{ms} do not support to fetch data")
+        return await ms.download(self, zero_copy)
+
+    async def fetch_to(self, ms: BaseMessageSegment, path: Union[str, Path]) -> Path:
+        """将媒体消息段的数据流式写入文件，中断后再次调用会从已下载的位置继续
+
+        参数:
+            ms: 消息段
+            path: 目标文件路径
         """
         if not isinstance(ms, MediaMessageSegment):
             raise ValueError(f"{ms} do not support to fetch data")
-        return await ms.download(self)
+        return await ms.download_to(self, path)
 
     async def fetch_media(
         self,
@@ -465,6 +647,69 @@ class Bot(BaseBot):
             count=count,
         )
 
+    async def iter_history(
+        self,
+        chat_type: ChatType,
+        target: Union[int, str],
+        offset_msg_id: Optional[str] = None,
+        count: int = 100,
+        until: Optional[datetime] = None,
+        min_seq: Optional[int] = None,
+    ) -> AsyncGenerator[Event, None]:
+        """从新到旧遍历历史消息
+
+        自动向前翻页并去除相邻两页中重复的消息，处理当前页时会预先拉取下一页；
+        消息在取出时才转换为事件，不支持的消息会被跳过
+
+        参数:
+            chat_type: 聊天类型，分为好友与群组
+            target: 目标 id
+            offset_msg_id: 从哪一条消息开始拉取，默认为最新的消息
+            count: 每页拉取多少消息
+            until: 遇到早于该时间的消息时停止
+            min_seq: 遇到 `msgSeq` 小于该值的消息时停止
+        """
+
+        async def _fetch(offset: Optional[str]) -> List[dict]:
+            resp = await self.get_history_messages(chat_type, target, offset, count)
+            page = resp.get("msgList", []) if isinstance(resp, dict) else resp
+            return sorted(
+                page,
+                key=lambda item: (int(item["msgTime"]), int(item["msgSeq"])),
+                reverse=True,
+            )
+
+        next_page = asyncio.ensure_future(_fetch(offset_msg_id))
+        seen: Set[str] = set()
+        try:
+            while next_page is not None:
+                page = await next_page
+                next_page = None
+                items = [item for item in page if item["msgId"] not in seen]
+                if not items:
+                    return
+                if len(page) >= count:
+                    next_page = asyncio.ensure_future(_fetch(items[-1]["msgId"]))
+                # 相邻两页只在边界处重叠，只需记住上一页的消息
+                seen = {item["msgId"] for item in page}
+                for item in items:
+                    if until and int(item["msgTime"]) < until.timestamp():
+                        return
+                    if min_seq is not None and int(item["msgSeq"]) < min_seq:
+                        return
+                    if not (
+                        cls := classifier.classify(message_key("message::recv", item))
+                    ):
+                        continue
+                    try:
+                        yield cls.convert(item)
+                    except Exception as e:
+                        text = escape_tag(str(item))
+                        log("WARNING", f"Failed to convert history message {text}", e)
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
     async def send_fake_forward(
         self,
         nodes: List[ForwardNode],
@@ -487,10 +732,14 @@ class Bot(BaseBot):
         peer = str(target)
         src_peer = str(source_target or target)
         base_seq = random.randint(0, 65535)
-        elems = []
-        for node in nodes:
-            elems.append(await node.export(base_seq, self, int(src_peer)))
-            base_seq += 1
+        # 所有节点中的图片一并上传，相同的图片只上传一次
+        uploaded = iter(
+            await upload_all(self, [seg for node in nodes for seg in node.images()])
+        )
+        elems = [
+            await node.export(base_seq + index, self, int(src_peer), uploaded)
+            for index, node in enumerate(nodes)
+        ]
         return await self.call_api(
             "send_fake_forward",
             chat_type=chat_type,
@@ -0,0 +1,90 @@
+import asyncio
+from dataclasses import field, dataclass
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    List,
+    Union,
+    Iterable,
+    Optional,
+    NamedTuple,
+    AsyncGenerator,
+)
+
+from .message import PreparedMessage
+from .api.model import Message as MessageModel
+
+if TYPE_CHECKING:
+    from .bot import Bot
+
+
+class BroadcastItem(NamedTuple):
+    """单个目标的群发结果"""
+
+    target: str
+    """目标 id"""
+    result: Optional[MessageModel] = None
+    """发送成功时的消息"""
+    error: Optional[Exception] = None
+    """发送失败时的异常"""
+
+
+@dataclass
+class BroadcastResult:
+    """群发的汇总结果"""
+
+    sent: Dict[str, MessageModel] = field(default_factory=dict)
+    """发送成功的目标及其消息"""
+    failed: Dict[str, Exception] = field(default_factory=dict)
+    """发送失败的目标及其异常"""
+
+    @property
+    def ok(self) -> bool:
+        """是否全部发送成功"""
+        return not self.failed
+
+
+async def iter_broadcast(
+    bot: "Bot",
+    chat_type: int,
+    targets: Iterable[Union[int, str]],
+    message: PreparedMessage,
+    concurrency: int,
+    interval: float,
+) -> AsyncGenerator[BroadcastItem, None]:
+    """向多个目标发送同一条消息，按完成顺序返回每个目标的结果
+
+    消息在发送前导出一次，各目标共用导出与上传的结果；
+    同时进行的发送数量受 `concurrency` 限制，
+    相邻两次发送的开始时间至少间隔 `interval` 秒。
+    """
+    await message.export(bot)
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(max(1, concurrency))
+    pace = asyncio.Lock()
+    last = -interval
+
+    async def _send(target: str) -> BroadcastItem:
+        nonlocal last
+        async with limit:
+            async with pace:
+                if (delay := last + interval - loop.time()) > 0:
+                    await asyncio.sleep(delay)
+                last = loop.time()
+            try:
+                return BroadcastItem(
+                    target, await bot.send_message(chat_type, target, message)
+                )
+            except Exception as e:
+                return BroadcastItem(target, error=e)
+
+    tasks: List[asyncio.Task] = [
+        asyncio.create_task(_send(target))
+        for target in dict.fromkeys(str(target) for target in targets)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
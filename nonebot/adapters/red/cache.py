@@ -0,0 +1,333 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from pathlib import Path
+from collections import OrderedDict
+from typing import Any, Dict, Tuple, Callable, Optional, Awaitable
+
+from nonebot.utils import run_sync
+from nonebot.compat import model_dump, type_validate_python
+
+from .utils import log
+from .api.model import UploadResponse
+
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+# 小于该大小的数据直接在事件循环中计算摘要，避免线程切换的开销
+HASH_INLINE_SIZE = 64 * 1024
+
+
+def _md5(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
+
+
+def _dump(path: Path, data: Any) -> None:
+    # 先写入临时文件再替换，读取方不会看到写了一半的文件
+    temp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        temp.write_text(json.dumps(data), encoding="utf-8")
+        temp.replace(path)
+    finally:
+        temp.unlink(missing_ok=True)
+
+
+async def digest(data: bytes) -> str:
+    """计算数据的 md5 摘要，较大的数据在线程池中计算"""
+    if len(data) <= HASH_INLINE_SIZE:
+        return _md5(data)
+    return await run_sync(_md5)(data)
+
+
+class UploadCache:
+    """以内容摘要为键的上传结果缓存
+
+    同一 Chronocat 主机上的所有 bot 共享缓存项，按最近使用淘汰并设有过期时间；
+    对于本机的 Chronocat，取出缓存项时会检查上传后的文件是否仍然存在。
+
+    参数:
+        size: 最多缓存的项数，为 0 时不缓存
+        ttl: 缓存项的有效时间，单位为秒
+        path: 持久化文件路径，为 `None` 时不持久化
+    """
+
+    def __init__(self, size: int, ttl: float, path: Optional[Path] = None) -> None:
+        self.size = size
+        self.ttl = ttl
+        self.path = path
+        self._entries: OrderedDict[
+            Tuple[str, str], Tuple[UploadResponse, float]
+        ] = OrderedDict()
+        self.on_set: Optional[Callable[[str, str, UploadResponse], None]] = None
+        """写入缓存项后调用，用于在分片之间同步"""
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, host: str, key: str) -> Optional[UploadResponse]:
+        """取出仍然有效的缓存项
+
+        参数:
+            host: Chronocat 主机
+            key: 数据的摘要
+        """
+        if (entry := self._entries.get((host, key))) is None:
+            return None
+        resp, stored_at = entry
+        if time.time() - stored_at > self.ttl or (
+            host in LOCAL_HOSTS and not Path(resp.ntFilePath).exists()
+        ):
+            del self._entries[(host, key)]
+            return None
+        self._entries.move_to_end((host, key))
+        return resp
+
+    def set(
+        self, host: str, key: str, resp: UploadResponse, notify: bool = True
+    ) -> None:
+        """写入缓存项
+
+        参数:
+            host: Chronocat 主机
+            key: 数据的摘要
+            resp: 上传结果
+            notify: 是否调用 `on_set`，由其他分片同步而来的缓存项不再通知
+        """
+        if self.size <= 0:
+            return
+        self._entries[(host, key)] = (resp, time.time())
+        self._entries.move_to_end((host, key))
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+        if notify and self.on_set is not None:
+            self.on_set(host, key, resp)
+
+    def discard(self, host: str, key: str) -> None:
+        """移除缓存项，例如 Chronocat 已经清理了对应的文件"""
+        self._entries.pop((host, key), None)
+
+    def load(self) -> None:
+        """从持久化文件中读取缓存项"""
+        if not self.path or not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            entries: Dict[Tuple[str, str], Tuple[UploadResponse, float]] = {
+                (host, key): (type_validate_python(UploadResponse, resp), stored_at)
+                for host, key, resp, stored_at in data
+            }
+        except Exception as e:
+            log("WARNING", f"Failed to load upload cache from {self.path}", e)
+            return
+        now = time.time()
+        for (host, key), (resp, stored_at) in entries.items():
+            if now - stored_at <= self.ttl:
+                self._entries[(host, key)] = (resp, stored_at)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+        log("DEBUG", f"Loaded {len(self._entries)} upload cache entries")
+
+    def save(self) -> None:
+        """将缓存项写入持久化文件"""
+        if not self.path:
+            return
+        data = [
+            [host, key, model_dump(resp), stored_at]
+            for (host, key), (resp, stored_at) in self._entries.items()
+        ]
+        try:
+            _dump(self.path, data)
+        except OSError as e:
+            log("WARNING", f"Failed to save upload cache to {self.path}", e)
+
+
+class SeenIndex:
+    """最近收到的消息 id 索引，用于去除重复推送的消息
+
+    以 bot 与 `msgId` 为键记录收到的时间，超过有效时间或数量上限时淘汰最早的记录，
+    占用的内存不超过 `size` 项。
+
+    参数:
+        size: 最多记录的消息数量，为 0 时不去重
+        ttl: 记录的有效时间，单位为秒
+        path: 持久化文件路径，为 `None` 时不持久化
+    """
+
+    def __init__(self, size: int, ttl: float, path: Optional[Path] = None) -> None:
+        self.size = size
+        self.ttl = ttl
+        self.path = path
+        self._entries: OrderedDict[Tuple[str, str], float] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expire(self, now: float) -> None:
+        # 记录按时间顺序插入，只需检查最早的记录
+        while self._entries:
+            key, seen_at = next(iter(self._entries.items()))
+            if now - seen_at <= self.ttl and len(self._entries) <= self.size:
+                break
+            del self._entries[key]
+
+    def add(self, bot_id: str, msg_id: str) -> bool:
+        """记录消息 id，有效时间内已经记录过时返回 `False`
+
+        参数:
+            bot_id: 收到消息的 bot
+            msg_id: 消息的 `msgId`
+        """
+        if self.size <= 0:
+            return True
+        now = time.time()
+        key = (bot_id, msg_id)
+        if (
+            seen_at := self._entries.get(key)
+        ) is not None and now - seen_at <= self.ttl:
+            return False
+        self._entries.pop(key, None)
+        self._entries[key] = now
+        self._expire(now)
+        return True
+
+    def load(self) -> None:
+        """从持久化文件中读取记录"""
+        if not self.path or not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            entries = [
+                ((str(bot_id), str(msg_id)), float(seen_at))
+                for bot_id, msg_id, seen_at in data
+            ]
+        except Exception as e:
+            log("WARNING", f"Failed to load message index from {self.path}", e)
+            return
+        for key, seen_at in sorted(entries, key=lambda entry: entry[1]):
+            self._entries[key] = seen_at
+        self._expire(time.time())
+        log("DEBUG", f"Loaded {len(self._entries)} message index entries")
+
+    def save(self) -> None:
+        """将记录写入持久化文件"""
+        if not self.path:
+            return
+        data = [
+            [bot_id, msg_id, seen_at]
+            for (bot_id, msg_id), seen_at in self._entries.items()
+        ]
+        try:
+            _dump(self.path, data)
+        except OSError as e:
+            log("WARNING", f"Failed to save message index to {self.path}", e)
+
+
+class MediaCache:
+    """收到的媒体数据的缓存
+
+    内存中按最近使用淘汰，总大小不超过 `size` 字节；
+    提供 `path` 时，已知 md5 的数据还会以 md5 为文件名保存在磁盘上。
+    同一媒体的并发获取只会发出一次请求，其余调用等待该请求的结果。
+
+    参数:
+        size: 内存缓存的总字节数上限，为 0 时不在内存中缓存
+        path: 磁盘缓存目录，为 `None` 时不使用磁盘缓存
+    """
+
+    def __init__(self, size: int, path: Optional[Path] = None) -> None:
+        self.size = size
+        self.path = path
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._used = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def used(self) -> int:
+        """内存缓存占用的字节数"""
+        return self._used
+
+    def _remember(self, key: str, data: bytes) -> None:
+        if len(data) > self.size:
+            return
+        if (old := self._entries.pop(key, None)) is not None:
+            self._used -= len(old)
+        self._entries[key] = data
+        self._used += len(data)
+        while self._used > self.size:
+            _, old = self._entries.popitem(last=False)
+            self._used -= len(old)
+
+    def _file(self, md5: str) -> Path:
+        assert self.path is not None
+        return self.path / md5[:2] / md5
+
+    def _read(self, md5: str) -> Optional[bytes]:
+        try:
+            return self._file(md5).read_bytes()
+        except OSError:
+            return None
+
+    def _write(self, md5: str, data: bytes) -> None:
+        file = self._file(md5)
+        temp = file.with_name(f"{md5}.{os.getpid()}.tmp")
+        try:
+            file.parent.mkdir(parents=True, exist_ok=True)
+            temp.write_bytes(data)
+            temp.replace(file)
+        except OSError as e:
+            log("WARNING", f"Failed to write media cache {file}", e)
+
+    async def _load(
+        self, key: str, md5: Optional[str], fetch: Callable[[], Awaitable[bytes]]
+    ) -> bytes:
+        if md5 and self.path and (data := await run_sync(self._read)(md5)):
+            self._remember(key, data)
+            return data
+        data = await fetch()
+        if md5 and await digest(data) != md5:
+            log("WARNING", f"Media {key} does not match its md5, skip caching")
+            return data
+        self._remember(key, data)
+        if md5 and self.path:
+            await run_sync(self._write)(md5, data)
+        return data
+
+    async def get(
+        self,
+        fetch: Callable[[], Awaitable[bytes]],
+        md5: Optional[str] = None,
+        uuid: Optional[str] = None,
+    ) -> bytes:
+        """取出缓存的媒体数据，不存在时调用 `fetch` 获取
+
+        md5 与 uuid 均未提供时不缓存，直接调用 `fetch`
+
+        参数:
+            fetch: 获取数据的函数
+            md5: 媒体的 md5，提供时校验获取到的数据并写入磁盘缓存
+            uuid: 媒体的 uuid
+        """
+        md5 = md5.lower() if md5 else None
+        if not (key := md5 or uuid):
+            return await fetch()
+        if (data := self._entries.get(key)) is not None:
+            self._entries.move_to_end(key)
+            return data
+        if (task := self._inflight.get(key)) is None:
+            task = self._inflight[key] = asyncio.create_task(
+                self._load(key, md5, fetch)
+            )
+            task.add_done_callback(lambda t: self._done(key, t))
+        # 单个调用者被取消时不影响其他等待同一请求的调用者
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()
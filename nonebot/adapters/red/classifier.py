@@ -0,0 +1,159 @@
+from typing import Any, Dict, List, Type, Tuple, Mapping, Optional, NamedTuple
+
+from .api.model import MsgType
+from .event import (
+    Event,
+    MemberAddEvent,
+    MemberMuteEvent,
+    GroupMessageEvent,
+    PrivateMessageEvent,
+    GroupNameUpdateEvent,
+)
+
+
+class EventKey(NamedTuple):
+    """事件分发键
+
+    规则中为 `None` 的字段可以匹配任意值
+    """
+
+    frameType: Optional[str] = None
+    """数据帧类型，如 `message::recv`"""
+    msgType: Optional[int] = None
+    sendType: Optional[int] = None
+    chatType: Optional[int] = None
+    subMsgType: Optional[int] = None
+    elementType: Optional[int] = None
+    """第一个元素的类型"""
+    subElementType: Optional[int] = None
+    """第一个元素中 `grayTipElement.subElementType`"""
+    groupElementType: Optional[int] = None
+    """第一个元素中 `grayTipElement.groupElement.type`"""
+    busiId: Optional[str] = None
+    """第一个元素中 `grayTipElement.xmlElement.busiId`"""
+    busiType: Optional[str] = None
+    """第一个元素中 `grayTipElement.xmlElement.busiType`"""
+
+
+def _field(data: Any, name: str) -> Any:
+    value = data.get(name) if isinstance(data, Mapping) else None
+    return value if isinstance(value, Mapping) else {}
+
+
+def message_key(frame_type: str, data: Any) -> EventKey:
+    """从未经校验的消息数据中读取分发键
+
+    数据不是对象时只返回帧类型，按不支持的消息处理
+    """
+    if not isinstance(data, Mapping):
+        return EventKey(frame_type)
+    elements = data.get("elements")
+    first = elements[0] if isinstance(elements, list) and elements else None
+    element = first if isinstance(first, Mapping) else {}
+    gray_tip = _field(element, "grayTipElement")
+    group = _field(gray_tip, "groupElement")
+    xml = _field(gray_tip, "xmlElement")
+    busi_type = xml.get("busiType")
+    return EventKey(
+        frame_type,
+        data["msgType"],
+        data["sendType"],
+        data["chatType"],
+        data.get("subMsgType"),
+        element.get("elementType"),
+        gray_tip.get("subElementType"),
+        group.get("type"),
+        xml.get("busiId"),
+        str(busi_type) if busi_type is not None else None,
+    )
+
+
+class EventClassifier:
+    """依据分发键选择事件类型
+
+    多条规则同时匹配时，指定字段最多的规则优先，其次是后注册的规则。
+    每个分发键的结果会被缓存，注册新规则时清空缓存。
+    """
+
+    def __init__(self, cache_size: int = 4096) -> None:
+        self.cache_size = cache_size
+        self._rules: List[Tuple[EventKey, Optional[Type[Event]]]] = []
+        self._index: Dict[EventKey, Optional[Type[Event]]] = {}
+
+    def register(self, rule: EventKey, target: Optional[Type[Event]]) -> None:
+        """注册一条规则，`target` 为 `None` 时表示不支持该类事件"""
+        self._rules.append((rule, target))
+        # 稳定排序，指定字段相同时保持注册顺序，查找时逆序遍历
+        self._rules.sort(key=lambda r: sum(field is not None for field in r[0]))
+        self._index.clear()
+
+    def classify(self, key: EventKey) -> Optional[Type[Event]]:
+        """查找分发键对应的事件类型，不支持时返回 `None`"""
+        try:
+            return self._index[key]
+        except KeyError:
+            pass
+        target = None
+        for rule, cls in reversed(self._rules):
+            if all(r is None or r == k for r, k in zip(rule, key)):
+                target = cls
+                break
+        if len(self._index) >= self.cache_size:
+            self._index.clear()
+        self._index[key] = target
+        return target
+
+
+classifier = EventClassifier()
+
+
+def register_event(
+    target: Type[Event], frameType: Optional[str] = "message::recv", **fields: Any
+) -> None:
+    """注册自定义事件类型
+
+    事件类需实现 `convert` 方法，接收未经校验的原始数据；
+    其余参数为 `EventKey` 的字段，未指定的字段匹配任意值。
+
+    用法:
+        ```python
+        register_event(
+            MyNoticeEvent,
+            msgType=5,
+            sendType=3,
+            subMsgType=8,
+            elementType=8,
+            subElementType=4,
+            groupElementType=12,
+        )
+        ```
+    """
+    classifier.register(EventKey(frameType, **fields), target)
+
+
+def _system_notice(**fields: Any) -> EventKey:
+    return EventKey("message::recv", MsgType.system, 3, elementType=8, **fields)
+
+
+# 其余数据帧作为基础事件
+classifier.register(EventKey(), Event)
+# 未知的消息与系统提示
+classifier.register(EventKey("message::recv"), None)
+classifier.register(EventKey("message::recv", MsgType.system, 3), None)
+classifier.register(EventKey("message::recv", chatType=1), PrivateMessageEvent)
+classifier.register(EventKey("message::recv", chatType=2), GroupMessageEvent)
+classifier.register(
+    _system_notice(subMsgType=8, subElementType=4, groupElementType=1), MemberAddEvent
+)
+classifier.register(
+    _system_notice(subMsgType=8, subElementType=4, groupElementType=8), MemberMuteEvent
+)
+classifier.register(
+    _system_notice(subMsgType=8, subElementType=4, groupElementType=5),
+    GroupNameUpdateEvent,
+)
+# 旧版受邀请入群
+classifier.register(
+    _system_notice(subMsgType=12, subElementType=12, busiId="10145", busiType="1"),
+    MemberAddEvent,
+)
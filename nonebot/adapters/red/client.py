@@ -0,0 +1,133 @@
+import asyncio
+from typing import TYPE_CHECKING, Any, Dict, Optional, AsyncGenerator
+
+from yarl import URL
+from nonebot.exception import ActionFailed, NetworkError
+from nonebot.drivers import Request, Response, HTTPClientMixin, HTTPClientSession
+
+from .utils import log
+from .config import BotInfo
+
+if TYPE_CHECKING:
+    from nonebot.adapters import Adapter
+
+
+class APIClient:
+    """bot 访问 Chronocat HTTP 接口的客户端
+
+    连接建立后持有一个长连接会话，复用 TCP 连接；
+    鉴权头与接口地址只构建一次，并限制同时进行的请求数量。
+    未打开会话时退化为通过适配器逐个发送请求。
+
+    参数:
+        adapter: 适配器
+        info: bot 配置
+        concurrency: 同时进行的请求数量上限
+    """
+
+    def __init__(self, adapter: "Adapter", info: BotInfo, concurrency: int = 16):
+        self.adapter = adapter
+        self.info = info
+        self.base = info.api_base
+        self.headers = {"Authorization": f"Bearer {info.token}"}
+        self.concurrency = max(1, concurrency)
+        self._routes: Dict[str, URL] = {}
+        self._session: Optional[HTTPClientSession] = None
+        self._limit: Optional[asyncio.Semaphore] = None
+
+    def route(self, path: str) -> URL:
+        """获取接口地址"""
+        if (url := self._routes.get(path)) is None:
+            url = self._routes[path] = self.base / path
+        return url
+
+    async def open(self) -> None:
+        """打开长连接会话，驱动器不支持会话时仍逐个发送请求"""
+        self._limit = asyncio.Semaphore(self.concurrency)
+        driver = self.adapter.driver
+        if self._session is None and isinstance(driver, HTTPClientMixin):
+            session = driver.get_session(headers=self.headers)
+            await session.setup()
+            self._session = session
+            log("DEBUG", f"HTTP session to {self.base} opened")
+
+    async def close(self) -> None:
+        """关闭长连接会话"""
+        if self._session is not None:
+            session, self._session = self._session, None
+            await session.close()
+            log("DEBUG", f"HTTP session to {self.base} closed")
+
+    def _build(self, method: str, path: str, **kwargs: Any) -> Request:
+        headers = {**self.headers, **kwargs.pop("headers", {})}
+        return Request(method, self.route(path), headers=headers, **kwargs)
+
+    def _check(self, resp: Response) -> Response:
+        # 206 为按范围请求时的部分内容
+        if resp.status_code not in (200, 206):
+            raise ActionFailed(
+                self.adapter.get_name(),
+                f"HTTP status code {resp.status_code} "
+                f"response body: {resp.content}",
+            )
+        return resp
+
+    async def request(self, method: str, path: str, **kwargs: Any) -> Response:
+        """向 Chronocat 发送请求
+
+        参数:
+            method: 请求方法
+            path: 接口路径，如 `message/send`
+            kwargs: 传递给 `Request` 的其余参数，`headers` 会与鉴权头合并
+        """
+        setup = self._build(method, path, **kwargs)
+        if self._limit is None:
+            self._limit = asyncio.Semaphore(self.concurrency)
+        async with self._limit:
+            if self._session is None:
+                return await self.adapter.request(setup)
+            try:
+                resp = await self._session.request(setup)
+            except Exception as e:
+                raise NetworkError(f"Failed to request {setup.url}") from e
+        return self._check(resp)
+
+    async def stream(
+        self, method: str, path: str, chunk_size: int = 64 * 1024, **kwargs: Any
+    ) -> AsyncGenerator[Response, None]:
+        """以流的形式向 Chronocat 发送请求，逐块返回响应
+
+        驱动器不支持流式请求时退化为一次性读取整个响应。
+
+        参数:
+            method: 请求方法
+            path: 接口路径
+            chunk_size: 每块的大小
+            kwargs: 传递给 `Request` 的其余参数，`headers` 会与鉴权头合并
+        """
+        setup = self._build(method, path, **kwargs)
+        source = self._session or self.adapter.driver
+        if self._limit is None:
+            self._limit = asyncio.Semaphore(self.concurrency)
+        if isinstance(source, (HTTPClientSession, HTTPClientMixin)) and hasattr(
+            source, "stream_request"
+        ):
+            async with self._limit:
+                started = False
+                try:
+                    async for resp in source.stream_request(
+                        setup, chunk_size=chunk_size
+                    ):
+                        if not started:
+                            self._check(resp)
+                            started = True
+                        yield resp
+                    return
+                except NotImplementedError:
+                    if started:
+                        raise
+                except (ActionFailed, NetworkError):
+                    raise
+                except Exception as e:
+                    raise NetworkError(f"Failed to request {setup.url}") from e
+        yield await self.request(method, path, **kwargs)
@@ -0,0 +1,96 @@
+import asyncio
+from typing import (
+    Any,
+    Set,
+    Dict,
+    List,
+    Tuple,
+    Callable,
+    Hashable,
+    Iterable,
+    Optional,
+    Awaitable,
+)
+
+Send = Callable[[List[Any]], Awaitable[Any]]
+
+
+class _Batch:
+    def __init__(self, send: Send) -> None:
+        self.send = send
+        self.members: Dict[Any, None] = {}
+        self.waiters: List[Tuple[List[Any], asyncio.Future]] = []
+        self.handle: Optional[asyncio.TimerHandle] = None
+
+
+class Coalescer:
+    """将短时间内针对同一群组的同类操作合并为批量请求
+
+    时间窗口内相同键的调用共用一个批次，窗口结束或成员数量达到上限时发送；
+    批次中的成员按上限分块请求，每个调用者只在包含其成员的请求失败时得到异常。
+
+    参数:
+        window: 合并的时间窗口，单位为秒，为 0 时不合并
+        size: 单个请求包含的成员数量上限
+    """
+
+    def __init__(self, window: float, size: int) -> None:
+        self.window = window
+        self.size = max(1, size)
+        self._batches: Dict[Hashable, _Batch] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _chunks(self, members: List[Any]) -> List[List[Any]]:
+        return [members[i : i + self.size] for i in range(0, len(members), self.size)]
+
+    async def submit(self, key: Hashable, members: Iterable[Any], send: Send) -> None:
+        """加入批次并等待包含这些成员的请求完成
+
+        参数:
+            key: 批次的键，只有键相同的调用会被合并
+            members: 操作的成员
+            send: 发送一个分块的函数，接收成员列表
+        """
+        members = list(members)
+        if self.window <= 0:
+            for chunk in self._chunks(members):
+                await send(chunk)
+            return
+        loop = asyncio.get_running_loop()
+        if (batch := self._batches.get(key)) is None:
+            batch = self._batches[key] = _Batch(send)
+            batch.handle = loop.call_later(self.window, self._flush, key, batch)
+        batch.members.update(dict.fromkeys(members))
+        future = loop.create_future()
+        batch.waiters.append((members, future))
+        if len(batch.members) >= self.size:
+            self._flush(key, batch)
+        await future
+
+    def _flush(self, key: Hashable, batch: _Batch) -> None:
+        if self._batches.get(key) is not batch:
+            return
+        del self._batches[key]
+        if batch.handle is not None:
+            batch.handle.cancel()
+        task = asyncio.create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: _Batch) -> None:
+        chunks = self._chunks(list(batch.members))
+        results = await asyncio.gather(
+            *(batch.send(chunk) for chunk in chunks), return_exceptions=True
+        )
+        failed: Dict[Any, BaseException] = {}
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, BaseException):
+                failed.update(dict.fromkeys(chunk, result))
+        for members, future in batch.waiters:
+            if future.done():
+                continue
+            error = next((failed[m] for m in members if m in failed), None)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(None)
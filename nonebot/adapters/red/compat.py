@@ -1,12 +1,25 @@
-from typing import Literal, overload
+from typing import Any, Type, Union, Literal, TypeVar, overload
 
+from pydantic import BaseModel
 from nonebot.compat import PYDANTIC_V2
 
-__all__ = ("model_validator",)
+__all__ = ("model_validator", "model_validate", "model_validate_json", "model_copy")
+
+M = TypeVar("M", bound=BaseModel)
 
 
 if PYDANTIC_V2:
     from pydantic import model_validator as model_validator
+
+    def model_validate(model: Type[M], data: Any) -> M:
+        return model.model_validate(data)
+
+    def model_validate_json(model: Type[M], data: Union[str, bytes]) -> M:
+        return model.model_validate_json(data)
+
+    def model_copy(model: M) -> M:
+        return model.model_copy()
+
 else:
     from pydantic import root_validator
 
@@ -20,3 +33,12 @@ else:
 
     def model_validator(*, mode: Literal["before", "after"]):
         return root_validator(pre=mode == "before", allow_reuse=True)
+
+    def model_validate(model: Type[M], data: Any) -> M:
+        return model.parse_obj(data)
+
+    def model_validate_json(model: Type[M], data: Union[str, bytes]) -> M:
+        return model.parse_raw(data)
+
+    def model_copy(model: M) -> M:
+        return model.copy()
@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Literal, Optional
 
 from yarl import URL
 from pydantic import Field, BaseModel
@@ -41,6 +41,114 @@ class Config(BaseModel):
     red_auto_detect: bool = False
     """是否自动检测 chronocat 配置，默认为 False"""
 
+    red_decoder: Literal["pydantic", "msgspec"] = "pydantic"
+    """事件解码器，`msgspec` 需要额外安装 `msgspec`，默认为 pydantic"""
+
+    red_api_concurrency: int = 16
+    """每个 bot 同时进行的 API 请求数量上限，默认为 16"""
+
+    red_upload_concurrency: int = 4
+    """发送单条消息时同时上传的媒体数量上限，默认为 4"""
+
+    red_upload_cache_size: int = 1024
+    """上传缓存最多保存的项数，为 0 时不缓存，默认为 1024"""
+
+    red_upload_cache_ttl: int = 86400
+    """上传缓存项的有效时间，单位为秒，默认为 1 天"""
+
+    red_upload_cache_path: Optional[Path] = None
+    """上传缓存的持久化文件路径，默认不持久化"""
+
+    red_media_cache_size: int = 64 * 1024 * 1024
+    """收到的媒体数据在内存中缓存的总字节数上限，为 0 时不缓存，默认为 64 MiB"""
+
+    red_media_cache_path: Optional[Path] = None
+    """收到的媒体数据的磁盘缓存目录，默认不使用磁盘缓存"""
+
+    red_roster_ttl: int = 300
+    """好友、群组与群成员资料缓存的有效时间，单位为秒，为 0 时不缓存，默认为 5 分钟"""
+
+    red_roster_warmup: bool = True
+    """是否在 bot 连接后预先获取好友与群组资料，默认为 True"""
+
+    red_broadcast_concurrency: int = 4
+    """群发时同时进行的发送数量上限，默认为 4"""
+
+    red_broadcast_interval: float = 0.5
+    """群发时相邻两次发送的最小间隔，单位为秒，默认为 0.5"""
+
+    red_send_rate: Optional[float] = None
+    """每个 bot 每秒发送的消息数量上限，默认不限制"""
+
+    red_send_friend_rate: Optional[float] = None
+    """每个 bot 每秒向所有好友发送的消息数量上限，默认不限制"""
+
+    red_send_group_rate: Optional[float] = None
+    """每个 bot 每秒向所有群组发送的消息数量上限，默认不限制"""
+
+    red_send_peer_rate: Optional[float] = None
+    """每个 bot 每秒向同一好友或群组发送的消息数量上限，默认不限制"""
+
+    red_send_burst: int = 5
+    """以上各项限制允许的突发发送数量，默认为 5"""
+
+    red_batch_window: float = 0.05
+    """合并禁言与移除群成员请求的时间窗口，单位为秒，为 0 时不合并，默认为 0.05"""
+
+    red_batch_size: int = 100
+    """合并后单个请求包含的群成员数量上限，默认为 100"""
+
+    red_dispatch_workers: int = 0
+    """同时处理事件的最大数量，为 0 时不限制，默认为 0"""
+
+    red_dispatch_queue_size: int = 1000
+    """每个 bot 排队的事件数量上限，不限制 worker 时包括处理中的事件，默认为 1000"""
+
+    red_dispatch_overflow: Literal["block", "drop_oldest", "drop_newest"] = "block"
+    """事件队列已满时的处理方式，默认为 block，即暂停读取该 bot 的事件"""
+
+    red_dispatch_order: Literal["none", "session", "scene"] = "none"
+    """事件的顺序保证，相同会话或相同群组/好友的事件依次处理，默认为 none"""
+
+    red_ping_interval: float = 30
+    """连接空闲多久后探测 Chronocat 是否存活，单位为秒，为 0 时不探测，默认为 30"""
+
+    red_ping_timeout: float = 10
+    """等待认证结果与探测结果的超时时间，单位为秒，默认为 10"""
+
+    red_idle_timeout: Optional[float] = None
+    """连接空闲多久后即使探测成功也重新连接，单位为秒，默认不限制"""
+
+    red_reconnect_delay: float = 1
+    """首次重连前等待时间的上限，之后每次失败翻倍，单位为秒，默认为 1"""
+
+    red_reconnect_max_delay: float = 60
+    """重连前等待时间的最大值，单位为秒，默认为 60"""
+
+    red_backfill: bool = False
+    """是否在发现漏收的消息时由历史消息补齐，默认为 False"""
+
+    red_backfill_concurrency: int = 4
+    """每个适配器同时进行的补齐数量上限，默认为 4"""
+
+    red_backfill_limit: int = 100
+    """单次补齐的消息数量上限，默认为 100"""
+
+    red_backfill_window: float = 600
+    """重新连接后补齐在断线前多少秒内活跃的聊天对象，单位为秒，默认为 600"""
+
+    red_dedup_size: int = 10000
+    """用于去除重复消息的 `msgId` 记录数量上限，为 0 时不去重，默认为 10000"""
+
+    red_dedup_ttl: int = 3600
+    """`msgId` 记录的有效时间，单位为秒，默认为 1 小时"""
+
+    red_dedup_path: Optional[Path] = None
+    """`msgId` 记录的持久化文件路径，默认不持久化"""
+
+    red_shards: int = 1
+    """将 bot 分配到多少个进程中运行，大于 1 时启用分片，默认为 1"""
+
 
 # get `home` path
 home = Path(os.path.expanduser("~"))
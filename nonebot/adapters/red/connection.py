@@ -0,0 +1,81 @@
+import time
+import random
+from enum import Enum
+from typing import Dict
+
+from .utils import log
+
+# 连接保持 `LIVE` 状态超过该时间后才清零连续失败的次数，单位为秒
+STABLE_TIME = 30.0
+
+
+class ConnectionState(str, Enum):
+    """连接的状态"""
+
+    CONNECTING = "connecting"
+    """正在建立 WebSocket 连接"""
+    AUTHENTICATING = "authenticating"
+    """已建立连接，正在等待认证结果"""
+    LIVE = "live"
+    """认证成功，正在接收事件"""
+    BACKING_OFF = "backing_off"
+    """连接断开，等待重连"""
+
+
+class Connection:
+    """与 Chronocat 的连接状态
+
+    记录当前状态与进入的时间，以及每个状态最近一次与累计持续的时间，
+    并依据连续失败的次数计算带随机抖动的指数退避重连间隔。
+
+    参数:
+        name: 连接的名称，用于日志
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.state = ConnectionState.CONNECTING
+        """当前状态"""
+        self.since = time.monotonic()
+        """进入当前状态的时间"""
+        self.last: Dict[ConnectionState, float] = {}
+        """每个状态最近一次持续的时间，单位为秒"""
+        self.total: Dict[ConnectionState, float] = {}
+        """每个状态累计持续的时间，单位为秒"""
+        self.failures = 0
+        """连续未能稳定保持 `LIVE` 状态的次数"""
+
+    @property
+    def elapsed(self) -> float:
+        """处于当前状态的时间，单位为秒"""
+        return time.monotonic() - self.since
+
+    def enter(self, state: ConnectionState) -> None:
+        """切换到新的状态"""
+        now = time.monotonic()
+        duration = now - self.since
+        self.last[self.state] = duration
+        self.total[self.state] = self.total.get(self.state, 0.0) + duration
+        log(
+            "DEBUG",
+            f"Connection {self.name}: {self.state.value} -> {state.value} "
+            f"after {duration:.3f}s",
+        )
+        # 认证后立即断开的连接不视为恢复，退避时间继续增长
+        if self.state == ConnectionState.LIVE and duration >= STABLE_TIME:
+            self.failures = 0
+        self.state, self.since = state, now
+
+    def backoff(self, base: float, cap: float) -> float:
+        """计算下一次重连前等待的时间，并增加连续失败的次数
+
+        等待时间的上限为 `base * 2 ** failures`，不超过 `cap`，
+        实际取上限的一半再加上不超过另一半的随机值，避免大量连接同时重连。
+
+        参数:
+            base: 首次重连的等待时间上限
+            cap: 等待时间的最大值
+        """
+        ceiling = min(cap, base * 2 ** min(self.failures, 32))
+        self.failures += 1
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
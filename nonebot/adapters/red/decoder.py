@@ -0,0 +1,175 @@
+import json
+from typing import Any, List, Type, Tuple, Union, Iterable, Optional
+
+from nonebot.compat import PYDANTIC_V2
+
+from .event import Event, MessageEvent
+from .compat import model_validate_json
+from .classifier import EventKey, message_key
+
+
+class Decoder:
+    """默认解码器
+
+    使用 `json` 解析整个数据帧，事件类直接由原始数据完成转换。
+    """
+
+    name = "pydantic"
+
+    def decode(self, data: Union[str, bytes]) -> Tuple[str, Any]:
+        """解析数据帧，返回帧类型与载荷"""
+        frame = json.loads(data)
+        return frame["type"], frame["payload"]
+
+    def split(self, payload: Any) -> Iterable[Any]:
+        """将 `message::recv` 的载荷拆分为单条消息"""
+        return payload
+
+    def key(self, frame_type: str, item: Any) -> EventKey:
+        """读取单条数据的分发键"""
+        if frame_type == "message::recv":
+            return message_key(frame_type, item)
+        return EventKey(frame_type)
+
+    def msg_id(self, item: Any) -> Optional[str]:
+        """读取单条消息的 `msgId`，用于在校验前去除重复的消息"""
+        return item.get("msgId") if isinstance(item, dict) else None
+
+    def load(self, item: Any) -> Any:
+        """将单条数据解析为 Python 对象，用于日志与自定义事件"""
+        return item
+
+    def to_event(self, item: Any, target: Type[Event]) -> Event:
+        """将单条数据转换为指定的事件"""
+        return target.convert(item)
+
+
+class MsgspecDecoder(Decoder):
+    """基于 msgspec 预编译 schema 的解码器
+
+    数据帧只解析外层结构，每条消息保留为原始 JSON 片段；
+    `msgId` 与分发键由预编译的 Struct 一次读取，消息事件则由原始字节一次性校验得到。
+    原始字节的校验依赖 pydantic v2，pydantic v1 下由 msgspec 解析后再校验。
+    """
+
+    name = "msgspec"
+
+    def __init__(self) -> None:
+        import msgspec
+
+        self._raw = msgspec.Raw
+        frame = msgspec.defstruct("Frame", [("type", str), ("payload", msgspec.Raw)])
+        xml = msgspec.defstruct(
+            "XmlHead",
+            [
+                ("busiId", Optional[str], None),
+                ("busiType", Union[str, int, None], None),
+            ],
+        )
+        group = msgspec.defstruct("GroupHead", [("type", Optional[int], None)])
+        gray_tip = msgspec.defstruct(
+            "GrayTipHead",
+            [
+                ("subElementType", Optional[int], None),
+                ("groupElement", Optional[group], None),
+                ("xmlElement", Optional[xml], None),
+            ],
+        )
+        element = msgspec.defstruct(
+            "ElementHead",
+            [
+                ("elementType", Optional[int], None),
+                ("grayTipElement", Optional[gray_tip], None),
+            ],
+        )
+        head = msgspec.defstruct(
+            "MessageHead",
+            [
+                ("msgType", int),
+                ("sendType", int),
+                ("chatType", int),
+                ("subMsgType", Optional[int], None),
+                ("msgId", Optional[str], None),
+                ("elements", List[element], []),
+            ],
+        )
+        self._frame = msgspec.json.Decoder(frame)
+        self._items = msgspec.json.Decoder(List[msgspec.Raw])
+        self._head = msgspec.json.Decoder(head)
+        self._any = msgspec.json.Decoder()
+        # 同一条消息会依次读取 `msgId` 与分发键，缓存最近一次读取的结果
+        self._last: Tuple[Any, Any] = (None, None)
+
+    def _read_head(self, item: Any) -> Any:
+        if self._last[0] is item:
+            return self._last[1]
+        # 数组中的原始 JSON 片段不含前导空白，首字节即可区分是否为对象
+        head = self._head.decode(item) if memoryview(item)[:1] == b"{" else None
+        self._last = (item, head)
+        return head
+
+    def decode(self, data: Union[str, bytes]) -> Tuple[str, Any]:
+        frame = self._frame.decode(data)
+        if frame.type == "message::recv":
+            return frame.type, self._items.decode(frame.payload)
+        return frame.type, self._any.decode(frame.payload)
+
+    def key(self, frame_type: str, item: Any) -> EventKey:
+        if not isinstance(item, self._raw):
+            return super().key(frame_type, item)
+        if (head := self._read_head(item)) is None:
+            return EventKey(frame_type)
+        element = head.elements[0] if head.elements else None
+        gray_tip = element and element.grayTipElement
+        group = gray_tip and gray_tip.groupElement
+        xml = gray_tip and gray_tip.xmlElement
+        return EventKey(
+            frame_type,
+            head.msgType,
+            head.sendType,
+            head.chatType,
+            head.subMsgType,
+            element and element.elementType,
+            gray_tip and gray_tip.subElementType,
+            group and group.type,
+            xml and xml.busiId,
+            str(xml.busiType) if xml and xml.busiType is not None else None,
+        )
+
+    def msg_id(self, item: Any) -> Optional[str]:
+        if not isinstance(item, self._raw):
+            return super().msg_id(item)
+        head = self._read_head(item)
+        return head and head.msgId
+
+    def load(self, item: Any) -> Any:
+        if isinstance(item, self._raw):
+            return self._any.decode(item)
+        return item
+
+    def to_event(self, item: Any, target: Type[Event]) -> Event:
+        if not isinstance(item, self._raw):
+            return target.convert(item)
+        # 未重写 `convert` 的消息事件直接由原始字节校验
+        if (
+            PYDANTIC_V2
+            and target.convert.__func__ is MessageEvent.convert.__func__  # type: ignore
+        ):
+            return model_validate_json(target, bytes(item))
+        return target.convert(self._any.decode(item))
+
+
+DECODERS = {
+    Decoder.name: Decoder,
+    MsgspecDecoder.name: MsgspecDecoder,
+}
+
+
+def get_decoder(name: str) -> Decoder:
+    """依据名称构造解码器
+
+    所需的依赖未安装时抛出 `ImportError`
+    """
+    if name not in DECODERS:
+        raise ValueError(f"Unknown decoder: {name}")
+    return DECODERS[name]()
@@ -0,0 +1,230 @@
+import asyncio
+from itertools import count
+from collections import deque
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Set,
+    Dict,
+    List,
+    Deque,
+    Tuple,
+    Literal,
+    Callable,
+    Optional,
+)
+
+from .utils import log
+from .event import Event, NoticeEvent, MessageEvent
+
+if TYPE_CHECKING:
+    from .bot import Bot
+
+OverflowPolicy = Literal["block", "drop_oldest", "drop_newest"]
+OrderMode = Literal["none", "session", "scene"]
+
+
+def session_key(event: Event) -> Optional[str]:
+    """以会话 id 作为顺序键，没有会话的事件不保证顺序"""
+    try:
+        return event.get_session_id()
+    except ValueError:
+        return None
+
+
+def scene_key(event: Event) -> Optional[str]:
+    """以群组或好友 id 作为顺序键"""
+    if isinstance(event, (MessageEvent, NoticeEvent)):
+        return event.scene
+    return None
+
+
+ORDER_KEYS: Dict[str, Optional[Callable[[Event], Optional[str]]]] = {
+    "none": None,
+    "session": session_key,
+    "scene": scene_key,
+}
+
+
+class _BotQueue:
+    def __init__(self, size: int) -> None:
+        self.items: Deque[Tuple[Bot, Event]] = deque()
+        self.space = asyncio.Semaphore(size)
+
+
+class EventDispatcher:
+    """有界的事件分发器
+
+    每个 bot 拥有独立的有界队列，固定数量的 worker 轮流从各个 bot 的队列中取出事件处理，
+    单个 bot 的事件洪峰不会占满其他 bot 的处理能力。
+
+    事件处理函数在等待后续事件时 (例如 `nonebot-plugin-waiter`) 会一直占用 worker，
+    这样的处理函数较多时可能耗尽 worker；启用顺序键时，它等待的同键事件也无法开始处理。
+    `workers` 不大于 0 时每个事件在各自的任务中处理，不限制 worker 的数量，
+    此时正在处理的事件同样计入队列上限，直到处理完毕，事件洪峰不会创建无限多的任务。
+
+    参数:
+        workers: 同时处理事件的最大数量，不大于 0 时不限制
+        queue_size: 每个 bot 等待处理的事件数量上限，
+            `workers` 不大于 0 时包括正在处理的事件
+        overflow: 队列已满时的处理方式，
+            `block` 暂停读取该 bot 的事件，
+            `drop_oldest` 丢弃最早的等待中的事件，没有等待中的事件时丢弃新到达的事件，
+            `drop_newest` 丢弃新到达的事件
+        key: 顺序键函数，顺序键相同的事件按到达顺序依次处理，不同顺序键的事件并行处理；
+            返回 `None` 或不提供时不保证顺序
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        queue_size: int,
+        overflow: OverflowPolicy = "block",
+        key: Optional[Callable[[Event], Optional[str]]] = None,
+    ) -> None:
+        self.workers = workers
+        self.queue_size = max(1, queue_size)
+        self.overflow = overflow
+        self.key = key
+        self._queues: Dict[str, _BotQueue] = {}
+        # 正在处理中的顺序键及其后续事件，处理完毕后立即移除；
+        # 后续事件附带暂存的序号，暂存的顺序即为到达的顺序
+        self._running: Dict[Tuple[str, Any], Deque[Tuple[int, Bot, Event]]] = {}
+        self._parked = count()
+        self._ready: Deque[str] = deque()
+        self._pending: Optional[asyncio.Semaphore] = None
+        self._tasks: List[asyncio.Task] = []
+        self._spawned: Set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        """启动 worker"""
+        self._pending = asyncio.Semaphore(0)
+        if self.workers <= 0:
+            self._tasks = [asyncio.create_task(self._spawner())]
+        else:
+            self._tasks = [
+                asyncio.create_task(self._worker()) for _ in range(self.workers)
+            ]
+
+    async def stop(self) -> None:
+        """停止 worker，丢弃尚未处理的事件"""
+        tasks = [*self._tasks, *self._spawned]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._spawned.clear()
+        self._queues.clear()
+        self._ready.clear()
+        self._running.clear()
+
+    def qsize(self, bot: Optional["Bot"] = None) -> int:
+        """等待处理的事件数量"""
+        if bot is not None:
+            queue = self._queues.get(bot.self_id)
+            return len(queue.items) if queue else 0
+        return sum(len(queue.items) for queue in self._queues.values())
+
+    async def put(self, bot: "Bot", event: Event) -> None:
+        """将事件加入对应 bot 的队列"""
+        assert self._pending is not None, "dispatcher is not started"
+        if not (queue := self._queues.get(bot.self_id)):
+            queue = self._queues[bot.self_id] = _BotQueue(self.queue_size)
+        if queue.space.locked():
+            if self.overflow == "drop_newest":
+                log("WARNING", f"Event queue of bot {bot.self_id} is full, drop event")
+                return
+            if self.overflow == "drop_oldest" and queue.items:
+                queue.items.popleft()
+                queue.items.append((bot, event))
+                log("WARNING", f"Event queue of bot {bot.self_id} is full, drop event")
+                return
+            if self.overflow == "drop_oldest" and self._evict(bot.self_id):
+                # 被丢弃的暂存事件占用的空间转交给新事件
+                self._ready.append(bot.self_id)
+                queue.items.append((bot, event))
+                self._pending.release()
+                log("WARNING", f"Event queue of bot {bot.self_id} is full, drop event")
+                return
+            if self.overflow == "drop_oldest":
+                # 队列空间全部被正在处理的事件占用
+                log("WARNING", f"Event queue of bot {bot.self_id} is full, drop event")
+                return
+        await queue.space.acquire()
+        if not queue.items:
+            self._ready.append(bot.self_id)
+        queue.items.append((bot, event))
+        self._pending.release()
+
+    def _evict(self, self_id: str) -> bool:
+        """丢弃 bot 最早暂存的同键事件，没有暂存的事件时返回 `False`"""
+        oldest = min(
+            (
+                waiting
+                for (owner, _), waiting in self._running.items()
+                if owner == self_id and waiting
+            ),
+            key=lambda waiting: waiting[0][0],
+            default=None,
+        )
+        if oldest is None:
+            return False
+        oldest.popleft()
+        return True
+
+    def _next(self) -> Tuple["Bot", Event]:
+        self_id = self._ready.popleft()
+        queue = self._queues[self_id]
+        item = queue.items.popleft()
+        if queue.items:
+            # 轮转到队尾，保证各个 bot 交替处理
+            self._ready.append(self_id)
+        return item
+
+    async def _handle(self, bot: "Bot", event: Event) -> None:
+        # 事件开始处理时才释放队列空间，等待中的同键事件同样计入队列上限；
+        # 不限制 worker 时处理完毕才释放，正在处理的事件同样计入队列上限
+        queue = self._queues[bot.self_id]
+        bounded = self.workers > 0
+        if bounded:
+            queue.space.release()
+        try:
+            await bot.handle_event(event)
+        except Exception as e:
+            log("ERROR", f"Error while handling event {event.get_event_name()}", e)
+        finally:
+            if not bounded:
+                queue.space.release()
+
+    async def _run(self, bot: "Bot", event: Event) -> None:
+        order = self.key and self.key(event)
+        if order is None:
+            await self._handle(bot, event)
+            return
+        key = (bot.self_id, order)
+        if (waiting := self._running.get(key)) is not None:
+            # 同键事件正在处理，交由处理该事件的任务依次处理
+            waiting.append((next(self._parked), bot, event))
+            return
+        waiting = self._running[key] = deque()
+        try:
+            await self._handle(bot, event)
+            while waiting:
+                _, bot, event = waiting.popleft()
+                await self._handle(bot, event)
+        finally:
+            del self._running[key]
+
+    async def _worker(self) -> None:
+        assert self._pending is not None
+        while True:
+            await self._pending.acquire()
+            await self._run(*self._next())
+
+    async def _spawner(self) -> None:
+        assert self._pending is not None
+        while True:
+            await self._pending.acquire()
+            task = asyncio.create_task(self._run(*self._next()))
+            self._spawned.add(task)
+            task.add_done_callback(self._spawned.discard)
@@ -1,21 +1,71 @@
 import re
-from copy import deepcopy
-from typing import Any, Dict, Optional
 from typing_extensions import override
 from datetime import datetime, timedelta
+from typing import Any, Dict, Tuple, Iterator, Optional, FrozenSet, SupportsIndex
 
 from nonebot.utils import escape_tag
+from pydantic import BaseModel, PrivateAttr
 from nonebot.compat import model_dump, type_validate_python
 
 from nonebot.adapters import Event as BaseEvent
 
-from .message import Message
-from .compat import model_validator
+from .compat import model_validate
+from .message import Message, MessageSegment
 from .api.model import Message as MessageModel
 from .api.model import MsgType, ChatType, ReplyElement, ShutUpTarget
 
 
+class _SharedMessage(Message):
+    """与 `original_message` 共享消息段的消息
+
+    共享的消息段在首次被取出时才复制，之后对其的修改不会影响 `original_message`；
+    只进行增删消息段等列表操作时不会复制消息段。
+    """
+
+    _shared: FrozenSet[int] = frozenset()
+
+    @classmethod
+    def share(cls, message: Message) -> "_SharedMessage":
+        shared = cls()
+        list.extend(shared, message)
+        shared._shared = frozenset(map(id, message))
+        return shared
+
+    def _own(self, index: SupportsIndex) -> MessageSegment:
+        seg = list.__getitem__(self, index)
+        if id(seg) in self._shared:
+            seg = type(seg)(seg.type, seg.data.copy())
+            list.__setitem__(self, index, seg)
+        return seg
+
+    def __iter__(self) -> Iterator[MessageSegment]:
+        i = 0
+        while i < len(self):
+            yield self._own(i)
+            i += 1
+
+    def __reversed__(self) -> Iterator[MessageSegment]:
+        for i in reversed(range(len(self))):
+            if i < len(self):
+                yield self._own(i)
+
+    def __getitem__(self, args: Any) -> Any:
+        if isinstance(args, int):
+            return self._own(args)
+        if isinstance(args, slice):
+            for i in range(*args.indices(len(self))):
+                self._own(i)
+        return super().__getitem__(args)
+
+    def pop(self, index: SupportsIndex = -1) -> MessageSegment:
+        self._own(index)
+        return super().pop(index)
+
+
 class Event(BaseEvent):
+    backfilled: bool = False
+    """是否为发现漏收后由历史消息补齐的事件"""
+
     @override
     def get_type(self) -> str:
         # 现阶段Red协议只有message事件
@@ -70,8 +120,8 @@ class MessageEvent(Event, MessageModel):
 
     :类型: ``Optional[ReplyElement]``
     """
-    message: Message
-    original_message: Message
+    _message: Optional[Message] = PrivateAttr(default=None)
+    _original_message: Optional[Message] = PrivateAttr(default=None)
 
     @override
     def get_type(self) -> str:
@@ -86,17 +136,50 @@ class MessageEvent(Event, MessageModel):
     def get_message(self) -> Message:
         return self.message
 
-    @model_validator(mode="before")
-    def check_message(cls, values: Dict[str, Any]) -> Dict[str, Any]:
-        if "elements" in values:
-            values["message"] = Message.from_red_message(
-                values["elements"],
-                values["msgId"],
-                values["chatType"],
-                values["peerUin"] or values["peerUid"],
+    @property
+    def original_message(self) -> Message:
+        """原始消息，首次访问时由 `elements` 转换得到"""
+        if self._original_message is None:
+            self._original_message = Message.from_red_message(
+                self.elements,
+                self.msgId,
+                self.chatType,
+                self.peerUin or self.peerUid,
             )
-            values["original_message"] = deepcopy(values["message"])
-        return values
+        return self._original_message
+
+    @property
+    def message(self) -> Message:
+        """经过预处理的消息，首次访问时由 `original_message` 得到
+
+        与 `original_message` 共享消息段，消息段在首次被取出时才复制，
+        修改消息段不会影响 `original_message`
+        """
+        if self._message is None:
+            self._message = _SharedMessage.share(self.original_message)
+            if not self._message:
+                self._message.append(MessageSegment.text(""))
+        return self._message
+
+    @message.setter
+    def message(self, message: Message) -> None:
+        self._message = message
+
+    @override
+    def __setattr__(self, name: str, value: Any) -> None:
+        # pydantic v1 不会调用 property 的 setter
+        if name == "message":
+            self._message = value
+        else:
+            super().__setattr__(name, value)
+
+    @classmethod
+    @override
+    def convert(cls, obj: Any):
+        if isinstance(obj, MessageModel):
+            # 已经校验过的消息模型，直接复用其字段
+            obj = dict(obj)
+        return model_validate(cls, obj)
 
     @override
     def get_user_id(self) -> str:
@@ -141,7 +224,7 @@ class PrivateMessageEvent(MessageEvent):
     def get_event_description(self) -> str:
         text = (
             f"Message from {self.sendNickName or self.senderUin or self.senderUid}: "
-            f"{self.get_message()}"
+            f"{self.original_message}"
         )
         return escape_tag(text)
 
@@ -161,7 +244,7 @@ class GroupMessageEvent(MessageEvent):
         text = (
             f"Message from {self.sendMemberName or self.senderUin or self.senderUid} "
             f"in {self.peerName or self.peerUin or self.peerUid}: "
-            f"{self.get_message()}"
+            f"{self.original_message}"
         )
         return escape_tag(text)
 
@@ -195,6 +278,27 @@ class NoticeEvent(Event):
         """群组或好友的id"""
         return self.peerUin or self.peerUid
 
+    @staticmethod
+    def extract_gray_tip(obj: Any) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """从消息数据中取出通知的公共字段与第一个元素中的灰条提示
+
+        只读取所需的字段，不会校验整个消息
+        """
+        if isinstance(obj, BaseModel):
+            obj = model_dump(obj)
+        params = {
+            "msgId": obj["msgId"],
+            "msgRandom": obj["msgRandom"],
+            "msgSeq": obj["msgSeq"],
+            "cntSeq": obj["cntSeq"],
+            "chatType": obj["chatType"],
+            "msgType": obj["msgType"],
+            "subMsgType": obj["subMsgType"],
+            "peerUid": obj.get("peerUid", "undefined"),
+            "peerUin": obj.get("peerUin", "-1"),
+        }
+        return params, obj["elements"][0]["grayTipElement"]
+
     class Config:
         extra = "ignore"
 
@@ -232,20 +336,13 @@ class GroupNameUpdateEvent(NoticeEvent):
     @classmethod
     @override
     def convert(cls, obj: Any):
-        assert isinstance(obj, MessageModel)
+        params, gray_tip = cls.extract_gray_tip(obj)
+        group = gray_tip["groupElement"]
         return cls(
-            msgId=obj.msgId,
-            msgRandom=obj.msgRandom,
-            msgSeq=obj.msgSeq,
-            cntSeq=obj.cntSeq,
-            chatType=obj.chatType,
-            msgType=obj.msgType,
-            subMsgType=obj.subMsgType,
-            peerUid=obj.peerUid,
-            peerUin=obj.peerUin,
-            currentName=obj.elements[0].grayTipElement.groupElement.groupName,  # type: ignore  # noqa: E501
-            operatorUid=obj.elements[0].grayTipElement.groupElement.memberUin,  # type: ignore  # noqa: E501
-            operatorName=obj.elements[0].grayTipElement.groupElement.memberNick,  # type: ignore  # noqa: E501
+            **params,
+            currentName=group.get("groupName"),
+            operatorUid=group.get("memberUin"),
+            operatorName=group.get("memberNick"),
         )
 
 
@@ -285,35 +382,18 @@ class MemberAddEvent(NoticeEvent):
     @classmethod
     @override
     def convert(cls, obj: Any):
-        assert isinstance(obj, MessageModel)
-        params = {
-            "msgId": obj.msgId,
-            "msgRandom": obj.msgRandom,
-            "msgSeq": obj.msgSeq,
-            "cntSeq": obj.cntSeq,
-            "chatType": obj.chatType,
-            "msgType": obj.msgType,
-            "subMsgType": obj.subMsgType,
-            "peerUid": obj.peerUid,
-            "peerUin": obj.peerUin,
-        }
-        if (
-            obj.elements[0].grayTipElement
-            and obj.elements[0].grayTipElement.xmlElement
-            and obj.elements[0].grayTipElement.xmlElement.content
-        ):  # type: ignore  # noqa: E501
-            # fmt: off
-            if not (mat := legacy_invite_message.search(obj.elements[0].grayTipElement.xmlElement.content)):  # type: ignore  # noqa: E501
+        params, gray_tip = cls.extract_gray_tip(obj)
+        xml = gray_tip.get("xmlElement")
+        if xml and xml.get("content"):
+            if not (mat := legacy_invite_message.search(xml["content"])):
                 raise ValueError("Invalid legacy invite message.")
-            # fmt: on
             params["operatorUid"] = mat[1]
             params["memberUid"] = mat[2]
         else:
-            params["memberUid"] = obj.elements[0].grayTipElement.groupElement.memberUin  # type: ignore  # noqa: E501
-            params["operatorUid"] = obj.elements[0].grayTipElement.groupElement.adminUin  # type: ignore  # noqa: E501
-            params["memberName"] = obj.elements[
-                0
-            ].grayTipElement.groupElement.memberNick  # type: ignore  # noqa: E501
+            group = gray_tip["groupElement"]
+            params["memberUid"] = group.get("memberUin")
+            params["operatorUid"] = group.get("adminUin")
+            params["memberName"] = group.get("memberNick")
         return cls(**params)
 
 
@@ -337,28 +417,12 @@ class MemberMuteEvent(NoticeEvent):
     @classmethod
     @override
     def convert(cls, obj: Any):
-        assert isinstance(obj, MessageModel)
-        # fmt: off
-        params = {
-            "msgId": obj.msgId,
-            "msgRandom": obj.msgRandom,
-            "msgSeq": obj.msgSeq,
-            "cntSeq": obj.cntSeq,
-            "chatType": obj.chatType,
-            "msgType": obj.msgType,
-            "subMsgType": obj.subMsgType,
-            "peerUid": obj.peerUid,
-            "peerUin": obj.peerUin,
-            "start": datetime.fromtimestamp(
-                obj.elements[0].grayTipElement.groupElement.shutUp.curTime  # type: ignore  # noqa: E501
-            ),
-            "duration": timedelta(
-                seconds=obj.elements[0].grayTipElement.groupElement.shutUp.duration  # type: ignore  # noqa: E501
-            ),
-            "operator": obj.elements[0].grayTipElement.groupElement.shutUp.admin,  # type: ignore  # noqa: E501
-            "member": obj.elements[0].grayTipElement.groupElement.shutUp.member, # type: ignore  # noqa: E501
-        }
-        # fmt: on
+        params, gray_tip = cls.extract_gray_tip(obj)
+        shut_up = gray_tip["groupElement"]["shutUp"]
+        params["start"] = datetime.fromtimestamp(int(shut_up["curTime"]))
+        params["duration"] = timedelta(seconds=int(shut_up["duration"]))
+        params["operator"] = shut_up["admin"]
+        params["member"] = shut_up["member"]
         if params["duration"].total_seconds() < 1:
             return MemberUnmuteEvent(**params)
         return MemberMutedEvent(**params)
@@ -0,0 +1,236 @@
+import io
+import os
+import mmap
+import asyncio
+import hashlib
+import tempfile
+from io import BytesIO
+from pathlib import Path
+from contextlib import asynccontextmanager
+from typing import IO, Any, Dict, List, Union, Optional, AsyncIterable, AsyncIterator
+
+from nonebot.utils import run_sync
+
+from .cache import digest
+
+# 分块读取的大小
+CHUNK_SIZE = 1024 * 1024
+# 异步字节流不超过该大小时保存在内存中，否则写入临时文件
+SPOOL_SIZE = 4 * 1024 * 1024
+
+MediaInput = Union[str, Path, BytesIO, bytes, IO[bytes], AsyncIterable[bytes]]
+
+
+def _hash_file(file: IO[bytes], offset: int = 0) -> str:
+    file.seek(offset)
+    md5 = hashlib.md5()
+    while chunk := file.read(CHUNK_SIZE):
+        md5.update(chunk)
+    return md5.hexdigest()
+
+
+def _hash_path(path: Path) -> str:
+    with path.open("rb") as f:
+        return _hash_file(f)
+
+
+def map_file(path: Path) -> Union[bytes, mmap.mmap]:
+    """以只读方式将文件映射到内存，空文件返回空字节串"""
+    with path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class _Window(io.RawIOBase):
+    """文件对象从 `offset` 开始的视图
+
+    `seek` 与 `tell` 的位置相对于 `offset`，驱动器发送前回到开头时不会越过数据的起始处；
+    驱动器发送后关闭视图时，调用者的文件对象保持打开
+    """
+
+    def __init__(self, file: IO[bytes], offset: int) -> None:
+        super().__init__()
+        self.file = file
+        self.offset = offset
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        return self.file.read(-1 if size is None else size)
+
+    def readinto(self, buffer: Any) -> int:
+        data = self.file.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def tell(self) -> int:
+        return self.file.tell() - self.offset
+
+    def seek(self, pos: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_SET:
+            pos += self.offset
+        return self.file.seek(pos, whence) - self.offset
+
+
+class MediaSource:
+    """延迟读取的媒体数据
+
+    构造消息段时只记录数据来源，计算摘要与上传时才分块读取，不会让整个文件常驻内存。
+    不支持 `seek` 的文件对象与异步字节流只能读取一次，首次使用时会被暂存。
+
+    参数:
+        source: 文件路径、二进制文件对象或异步字节流
+    """
+
+    def __init__(self, source: MediaInput) -> None:
+        if isinstance(source, str):
+            source = Path(source)
+        elif isinstance(source, BytesIO):
+            # 内存中的数据直接复制，不与调用者共享读写位置
+            source = source.getvalue()
+        self.source: Union[bytes, Path, IO[bytes], AsyncIterable[bytes]] = source
+        self._offset = 0
+        self._digest: Optional[str] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._owner: Optional[asyncio.Lock] = None
+        if isinstance(source, (bytes, Path)) or not hasattr(source, "read"):
+            return
+        if source.seekable():  # type: ignore
+            self._offset = source.tell()  # type: ignore
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> "MediaSource":
+        # 数据来源只读且读取过程已经互斥，复制的消息段共用同一个数据来源
+        return self
+
+    def __repr__(self) -> str:
+        if isinstance(self.source, bytes):
+            return f"MediaSource(<{len(self.source)} bytes>)"
+        return f"MediaSource({self.source!r})"
+
+    @property
+    def path(self) -> Optional[Path]:
+        """数据来源为文件路径时返回该路径"""
+        return self.source if isinstance(self.source, Path) else None
+
+    def _replayable(self) -> bool:
+        source = self.source
+        if isinstance(source, (bytes, Path)):
+            return True
+        return hasattr(source, "read") and source.seekable()  # type: ignore
+
+    async def _spool(self) -> None:
+        """将只能读取一次的数据暂存到内存或临时文件中，同时计算摘要"""
+        md5 = hashlib.md5()
+        chunks: List[bytes] = []
+        size = 0
+        spooled: Optional[IO[bytes]] = None
+        source = self.source
+        if hasattr(source, "read"):
+            read = run_sync(source.read)  # type: ignore
+
+            async def _iter() -> AsyncIterator[bytes]:
+                while chunk := await read(CHUNK_SIZE):
+                    yield chunk
+
+            stream: AsyncIterable[bytes] = _iter()
+        else:
+            stream = source  # type: ignore
+        try:
+            async for chunk in stream:
+                md5.update(chunk)
+                if spooled is not None:
+                    await run_sync(spooled.write)(chunk)
+                    continue
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > SPOOL_SIZE:
+                    spooled = await run_sync(tempfile.TemporaryFile)()
+                    await run_sync(spooled.writelines)(chunks)
+                    chunks.clear()
+        except BaseException:
+            if spooled is not None:
+                spooled.close()
+            raise
+        self.source = b"".join(chunks) if spooled is None else spooled
+        self._offset = 0
+        self._digest = md5.hexdigest()
+
+    async def _ensure(self) -> None:
+        if self._replayable():
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._replayable():
+                await self._spool()
+
+    @asynccontextmanager
+    async def _own(self) -> AsyncIterator[None]:
+        """独占文件对象的读写位置，同一时间只有一个调用者读取"""
+        if self._owner is None:
+            self._owner = asyncio.Lock()
+        async with self._owner:
+            yield
+
+    async def digest(self) -> str:
+        """计算数据的 md5 摘要，结果会被缓存"""
+        await self._ensure()
+        if self._digest is None:
+            source = self.source
+            if isinstance(source, bytes):
+                self._digest = await digest(source)
+            elif isinstance(source, Path):
+                self._digest = await run_sync(_hash_path)(source)
+            else:
+                async with self._own():
+                    if self._digest is None:
+                        self._digest = await run_sync(_hash_file)(
+                            source, self._offset  # type: ignore
+                        )
+        return self._digest
+
+    @asynccontextmanager
+    async def open(self) -> AsyncIterator[Union[bytes, IO[bytes]]]:
+        """打开数据，得到字节串或位于数据起始处的文件对象，可直接作为上传的文件内容
+
+        由路径打开的文件在退出时关闭；调用者传入的文件对象保持打开，
+        退出前由当前调用独占，得到的是从数据起始处开始的视图。
+        """
+        await self._ensure()
+        source = self.source
+        if isinstance(source, bytes):
+            yield source
+        elif isinstance(source, Path):
+            file = await run_sync(source.open)("rb")
+            try:
+                yield file
+            finally:
+                file.close()
+        else:
+            async with self._own():
+                await run_sync(source.seek)(self._offset)  # type: ignore
+                yield _Window(source, self._offset)  # type: ignore
+
+    async def read(self) -> bytes:
+        """读取全部数据"""
+        async with self.open() as data:
+            if isinstance(data, bytes):
+                return data
+            return await run_sync(data.read)()
+
+
+def as_media(file: Union[MediaInput, MediaSource]) -> Union[bytes, MediaSource]:
+    """将媒体消息段的数据来源包装为延迟读取的形式
+
+    字节串保持不变，`BytesIO` 取出其内容，不与调用者共享读写位置
+    """
+    if isinstance(file, (bytes, MediaSource)):
+        return file
+    if isinstance(file, BytesIO):
+        return file.getvalue()
+    return MediaSource(file)
@@ -1,19 +1,37 @@
+import mmap
+import time
 import random
-from io import BytesIO
+import shutil
+import asyncio
 from pathlib import Path
 from datetime import datetime
 from typing_extensions import override
 from dataclasses import field, dataclass
-from typing import TYPE_CHECKING, List, Type, Union, Iterable, Optional
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    List,
+    Type,
+    Tuple,
+    Union,
+    Iterable,
+    Iterator,
+    Optional,
+    AsyncGenerator,
+)
 
+from nonebot.utils import run_sync
 from nonebot.exception import NetworkError
-from nonebot.internal.driver import Request
 
 from nonebot.adapters import Message as BaseMessage
 from nonebot.adapters import MessageSegment as BaseMessageSegment
 
 from .utils import log
+from .cache import LOCAL_HOSTS, digest
+from .compat import model_validate_json
 from .api.model import Element, UploadResponse
+from .media import CHUNK_SIZE, MediaInput, MediaSource, as_media, map_file
 
 if TYPE_CHECKING:
     from .bot import Bot
@@ -50,46 +68,22 @@ class MessageSegment(BaseMessageSegment["Message"]):
         return MessageSegment("at_all")
 
     @staticmethod
-    def image(file: Union[str, Path, BytesIO, bytes]) -> "MessageSegment":
-        if isinstance(file, str):
-            file = Path(file)
-        if isinstance(file, Path):
-            file = file.read_bytes()
-        elif isinstance(file, BytesIO):
-            file = file.getvalue()
-        return MediaMessageSegment("image", {"file": file})
+    def image(file: MediaInput) -> "MessageSegment":
+        return MediaMessageSegment("image", {"file": as_media(file)})
 
     @staticmethod
-    def file(file: Union[str, Path, BytesIO, bytes]) -> "MessageSegment":
-        if isinstance(file, str):
-            file = Path(file)
-        if isinstance(file, Path):
-            file = file.read_bytes()
-        elif isinstance(file, BytesIO):
-            file = file.getvalue()
-        return MediaMessageSegment("file", {"file": file})
+    def file(file: MediaInput) -> "MessageSegment":
+        return MediaMessageSegment("file", {"file": as_media(file)})
 
     @staticmethod
-    def voice(
-        file: Union[str, Path, BytesIO, bytes], duration: int = 1
-    ) -> "MessageSegment":
-        if isinstance(file, str):
-            file = Path(file)
-        if isinstance(file, Path):
-            file = file.read_bytes()
-        elif isinstance(file, BytesIO):
-            file = file.getvalue()
-        return MediaMessageSegment("voice", {"file": file, "duration": duration})
+    def voice(file: MediaInput, duration: int = 1) -> "MessageSegment":
+        return MediaMessageSegment(
+            "voice", {"file": as_media(file), "duration": duration}
+        )
 
     @staticmethod
-    def video(file: Union[str, Path, BytesIO, bytes]) -> "MessageSegment":
-        if isinstance(file, str):
-            file = Path(file)
-        if isinstance(file, Path):
-            file = file.read_bytes()
-        elif isinstance(file, BytesIO):
-            file = file.getvalue()
-        return MediaMessageSegment("video", {"file": file})
+    def video(file: MediaInput) -> "MessageSegment":
+        return MediaMessageSegment("video", {"file": as_media(file)})
 
     @staticmethod
     def face(face_id: str) -> "MessageSegment":
@@ -135,46 +129,205 @@ class MessageSegment(BaseMessageSegment["Message"]):
 
 
 class MediaMessageSegment(MessageSegment):
-    async def download(self, bot: "Bot") -> bytes:
-        path = Path(self.data["path"])
-        if path.exists():
-            with path.open("rb") as f:
-                return f.read()
-        resp = await bot.adapter.request(
-            Request(
-                "POST",
-                bot.info.api_base / "message" / "fetchRichMedia",
-                headers={"Authorization": f"Bearer {bot.info.token}"},
-                json={
-                    "msgId": self.data["_msg_id"],
-                    "chatType": self.data["_chat_type"],
-                    "peerUid": self.data["_peer_uin"],
-                    "elementId": self.data["id"],
-                    "thumbSize": 0,
-                    "downloadType": 2,
-                },
+    async def local_path(self) -> Optional[Path]:
+        """媒体文件在本机缓存中的路径，文件不存在时返回 `None`
+
+        只需转发或计算摘要时可以直接使用该路径，无需读取文件内容
+        """
+        if not (path := self.data.get("path")):
+            return None
+        path = Path(path)
+        return path if await run_sync(path.is_file)() else None
+
+    def _fetch_params(self) -> dict:
+        return {
+            "msgId": self.data["_msg_id"],
+            "chatType": self.data["_chat_type"],
+            "peerUid": self.data["_peer_uin"],
+            "elementId": self.data["id"],
+            "thumbSize": 0,
+            "downloadType": 2,
+        }
+
+    async def download(
+        self, bot: "Bot", zero_copy: bool = False
+    ) -> Union[bytes, mmap.mmap]:
+        """获取媒体数据
+
+        本机存在缓存文件时在线程池中读取，否则通过 Chronocat 下载；
+        下载的数据由适配器的 `media_cache` 缓存，同一媒体的并发下载只会发出一次请求
+
+        参数:
+            bot: Bot 对象
+            zero_copy: 本机缓存文件是否以只读方式映射到内存，而不是复制文件内容
+        """
+        if (path := await self.local_path()) is not None:
+            if zero_copy:
+                return await run_sync(map_file)(path)
+            return await run_sync(path.read_bytes)()
+
+        async def _fetch() -> bytes:
+            resp = await bot.client.request(
+                "POST", "message/fetchRichMedia", json=self._fetch_params()
             )
+            if resp.status_code == 200:
+                return resp.content  # type: ignore
+            raise NetworkError("red", resp)
+
+        return await bot.adapter.media_cache.get(
+            _fetch, self.data.get("md5"), self.data.get("uuid")
         )
-        if resp.status_code == 200:
-            return resp.content  # type: ignore
-        raise NetworkError("red", resp)
+
+    async def iter_chunks(
+        self, bot: "Bot", chunk_size: int = CHUNK_SIZE, offset: int = 0
+    ) -> AsyncGenerator[bytes, None]:
+        """逐块获取媒体数据，不会将整个文件读入内存
+
+        参数:
+            bot: Bot 对象
+            chunk_size: 每块的大小
+            offset: 起始位置，通过 Chronocat 下载时以 `Range` 请求从该位置继续；
+                Chronocat 不支持按范围请求时会丢弃该位置之前的数据
+        """
+        if (path := await self.local_path()) is not None:
+            file = await run_sync(path.open)("rb")
+            try:
+                await run_sync(file.seek)(offset)
+                while chunk := await run_sync(file.read)(chunk_size):
+                    yield chunk
+            finally:
+                file.close()
+            return
+        stream = bot.client.stream(
+            "POST",
+            "message/fetchRichMedia",
+            chunk_size,
+            json=self._fetch_params(),
+            headers={"Range": f"bytes={offset}-"} if offset else {},
+        )
+        skip = None
+        try:
+            async for resp in stream:
+                if skip is None:
+                    skip = offset if offset and resp.status_code != 206 else 0
+                chunk: bytes = resp.content  # type: ignore
+                if skip:
+                    chunk, skip = chunk[skip:], max(0, skip - len(chunk))
+                if chunk:
+                    yield chunk
+        finally:
+            await stream.aclose()
+
+    async def download_to(
+        self, bot: "Bot", path: Union[str, Path], chunk_size: int = CHUNK_SIZE
+    ) -> Path:
+        """将媒体数据流式写入文件
+
+        下载中的数据先写入 `<path>.part`，完成后重命名为目标文件；
+        该文件已存在时从其末尾继续下载。
+
+        参数:
+            bot: Bot 对象
+            path: 目标文件路径
+            chunk_size: 每块的大小
+        """
+        path = Path(path)
+        if (local := await self.local_path()) is not None:
+            await run_sync(shutil.copyfile)(local, path)
+            return path
+        part = path.with_name(f"{path.name}.part")
+        file = await run_sync(part.open)("ab")
+        try:
+            offset = await run_sync(file.tell)()
+            async for chunk in self.iter_chunks(bot, chunk_size, offset):
+                await run_sync(file.write)(chunk)
+        finally:
+            file.close()
+        await run_sync(part.replace)(path)
+        return path
 
     async def upload(self, bot: "Bot") -> UploadResponse:
-        data = self.data["file"] if self.data.get("file") else await self.download(bot)
+        return await self._upload(bot, None)
+
+    async def _upload(self, bot: "Bot", key: Optional[str]) -> UploadResponse:
+        # `key` 为调用者已经计算的 `file` 的摘要
+        if self.data.get("file"):
+            data = self.data["file"]
+            key = key or await _file_digest(self)
+        elif (path := await self.local_path()) is not None:
+            data = MediaSource(path)
+            key = await data.digest()
+        else:
+            data = await self.download(bot)
+            key = await digest(data)
+        cache = bot.adapter.upload_cache
+        if (resp := cache.get(bot.info.host, key)) is not None:
+            return resp
         filename = f"{self.type}_{id(self)}"
         if self.type == "voice":
             filename += ".amr"
-        resp = await bot.adapter.request(
-            Request(
-                "POST",
-                bot.info.api_base / "upload",
-                headers={
-                    "Authorization": f"Bearer {bot.info.token}",
-                },
-                files={f"file_{self.type}": (filename, data)},
+        if isinstance(data, MediaSource):
+            # 以文件对象作为请求内容，由驱动器分块发送
+            async with data.open() as body:
+                resp = await bot.client.request(
+                    "POST", "upload", files={f"file_{self.type}": (filename, body)}
+                )
+        else:
+            resp = await bot.client.request(
+                "POST", "upload", files={f"file_{self.type}": (filename, data)}
             )
-        )
-        return UploadResponse.parse_raw(resp.content)  # type: ignore
+        result = model_validate_json(UploadResponse, resp.content)  # type: ignore
+        cache.set(bot.info.host, key, result)
+        return result
+
+
+async def _file_digest(seg: MessageSegment) -> str:
+    file = seg.data["file"]
+    if isinstance(file, MediaSource):
+        return await file.digest()
+    return await digest(file)
+
+
+async def _upload_key(seg: MessageSegment) -> Tuple[Any, ...]:
+    if seg.data.get("file"):
+        return "file", await _file_digest(seg)
+    if seg.data.get("id"):
+        return "element", seg.data.get("_msg_id"), seg.data["id"]
+    return "segment", id(seg)
+
+
+async def upload_all(
+    bot: "Bot", segments: List[MessageSegment]
+) -> List[UploadResponse]:
+    """并发上传多个媒体消息段，结果与消息段的顺序一致
+
+    内容相同的消息段只会上传一次；同时进行的上传数量受 `red_upload_concurrency` 限制；
+    任意一个上传失败时取消其余上传并抛出该异常。
+    """
+    if not segments:
+        return []
+    limit = asyncio.Semaphore(bot.adapter.red_config.red_upload_concurrency)
+
+    async def _upload(seg: MessageSegment, key: Tuple[Any, ...]) -> UploadResponse:
+        if TYPE_CHECKING:
+            assert isinstance(seg, MediaMessageSegment)
+        async with limit:
+            # 内容的摘要已经作为去重的键计算过，上传时不再重复计算
+            return await seg._upload(bot, key[1] if key[0] == "file" else None)
+
+    keys = await asyncio.gather(*(_upload_key(seg) for seg in segments))
+    tasks: Dict[Tuple[Any, ...], asyncio.Future] = {}
+    for key, seg in zip(keys, segments):
+        if key not in tasks:
+            tasks[key] = asyncio.ensure_future(_upload(seg, key))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    return [tasks[key].result() for key in keys]
 
 
 class Message(BaseMessage[MessageSegment]):
@@ -363,7 +516,19 @@ class Message(BaseMessage[MessageSegment]):
                 )
         return msg
 
-    async def export(self, bot: "Bot") -> List[dict]:
+    async def export(self, bot: "Bot", group: Optional[str] = None) -> List[dict]:
+        """导出为 Chronocat 的消息元素
+
+        参数:
+            bot: Bot 对象
+            group: 发送的目标群组，用于查找未指定名称的 at 的群名片
+        """
+        uploaded = iter(
+            await upload_all(
+                bot,
+                [seg for seg in self if seg.type in ("image", "file", "voice")],
+            )
+        )
         res = []
         for seg in self:
             if seg.type == "text":
@@ -371,13 +536,18 @@ class Message(BaseMessage[MessageSegment]):
                     {"elementType": 1, "textElement": {"content": seg.data["text"]}}
                 )
             elif seg.type == "at":
+                name = (
+                    seg.data["user_name"]
+                    or bot.roster.display_name(seg.data["user_id"], group)
+                    or seg.data["user_id"]
+                )
                 res.append(
                     {
                         "elementType": 1,
                         "textElement": {
                             "atType": 2,
                             "atNtUin": seg.data["user_id"],
-                            "content": f"@{seg.data['user_name'] or seg.data['user_id']}",  # noqa: E501
+                            "content": f"@{name}",
                         },
                     }
                 )
@@ -386,7 +556,7 @@ class Message(BaseMessage[MessageSegment]):
             elif seg.type == "image":
                 if TYPE_CHECKING:
                     assert isinstance(seg, MediaMessageSegment)
-                resp = await seg.upload(bot)
+                resp = next(uploaded)
                 file = Path(resp.ntFilePath)
                 res.append(
                     {
@@ -405,7 +575,7 @@ class Message(BaseMessage[MessageSegment]):
             elif seg.type == "file":
                 if TYPE_CHECKING:
                     assert isinstance(seg, MediaMessageSegment)
-                resp = await seg.upload(bot)
+                resp = next(uploaded)
                 file = Path(resp.ntFilePath)
                 res.append(
                     {
@@ -430,7 +600,7 @@ class Message(BaseMessage[MessageSegment]):
             elif seg.type == "voice":
                 if TYPE_CHECKING:
                     assert isinstance(seg, MediaMessageSegment)
-                resp = await seg.upload(bot)
+                resp = next(uploaded)
                 file = Path(resp.ntFilePath)
                 res.append(
                     {
@@ -490,6 +660,59 @@ class Message(BaseMessage[MessageSegment]):
         return res
 
 
+def _media_paths(elements: List[dict]) -> List[str]:
+    paths = []
+    for element in elements:
+        if pic := element.get("picElement"):
+            paths.append(pic["sourcePath"])
+        elif file := element.get("fileElement"):
+            paths.append(file["filePath"])
+        elif ptt := element.get("pttElement"):
+            paths.append(ptt["filePath"])
+    return paths
+
+
+class PreparedMessage:
+    """预先导出的消息，可以重复发送而不必每次导出与上传
+
+    发送时若上传的文件可能已被 Chronocat 清理 (超过上传缓存的有效时间，
+    或本机 Chronocat 上的文件已不存在)，或使用了另一个 Chronocat 主机上的 bot，
+    会重新导出消息，其中仍然有效的媒体不会重新上传。
+
+    参数:
+        message: 消息
+        group: 发送的目标群组，用于查找未指定名称的 at 的群名片
+    """
+
+    def __init__(self, message: Message, group: Optional[str] = None) -> None:
+        if message.has("forward"):
+            raise ValueError("Forward message cannot be prepared")
+        self.message = message
+        self.group = group
+        self.elements: List[dict] = []
+        self._host: Optional[str] = None
+        self._prepared_at = 0.0
+        self._paths: List[str] = []
+
+    async def _valid(self, bot: "Bot") -> bool:
+        if self._host != bot.info.host:
+            return False
+        if time.time() - self._prepared_at > bot.adapter.upload_cache.ttl:
+            return False
+        if bot.info.host in LOCAL_HOSTS:
+            return await run_sync(all)(Path(path).exists() for path in self._paths)
+        return True
+
+    async def export(self, bot: "Bot") -> List[dict]:
+        """取出消息元素，必要时重新导出"""
+        if not await self._valid(bot):
+            self.elements = await self.message.export(bot, self.group)
+            self._host = bot.info.host
+            self._prepared_at = time.time()
+            self._paths = _media_paths(self.elements)
+        return self.elements
+
+
 @dataclass
 class ForwardNode:
     uin: str
@@ -498,19 +721,45 @@ class ForwardNode:
     group: Union[int, str, None] = None
     time: datetime = field(default_factory=datetime.now)
 
-    async def export(self, seq: int, bot: "Bot", group: int) -> dict:
+    def images(self) -> List[MessageSegment]:
+        """节点中需要上传的图片消息段"""
+        return [seg for seg in self.message if seg.type == "image"]
+
+    async def export(
+        self,
+        seq: int,
+        bot: "Bot",
+        group: int,
+        uploaded: Optional[Iterator[UploadResponse]] = None,
+    ) -> dict:
+        """导出合并转发节点
+
+        参数:
+            seq: 节点的序号
+            bot: Bot 对象
+            group: 默认的来源群组
+            uploaded: 预先上传的图片结果，按图片在节点中出现的顺序排列；
+                未提供时由该节点自行上传
+        """
+        if uploaded is None:
+            uploaded = iter(await upload_all(bot, self.images()))
         elems = []
         for seg in self.message:
             if seg.type == "text":
                 elems.append({"text": {"str": seg.data["text"]}})
             elif seg.type == "at":
-                elems.append({"text": {"str": f"@{seg.data['user_id']}"}})
+                name = (
+                    seg.data["user_name"]
+                    or bot.roster.display_name(seg.data["user_id"], self.group or group)
+                    or seg.data["user_id"]
+                )
+                elems.append({"text": {"str": f"@{name}"}})
             elif seg.type == "at_all":
                 elems.append({"text": {"str": "@全体成员"}})
             elif seg.type == "image":
                 if TYPE_CHECKING:
                     assert isinstance(seg, MediaMessageSegment)
-                resp = await seg.upload(bot)
+                resp = next(uploaded)
                 md5 = resp.md5
                 file = Path(resp.ntFilePath)
                 pid = f"{{{md5[:8].upper()}-{md5[8:12].upper()}-{md5[12:16].upper()}-{md5[16:20].upper()}-{md5[20:].upper()}}}{file.suffix}"  # noqa: E501
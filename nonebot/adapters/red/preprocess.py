@@ -0,0 +1,218 @@
+import re
+from functools import lru_cache
+from dataclasses import dataclass
+from typing import (
+    TYPE_CHECKING,
+    Set,
+    List,
+    Tuple,
+    Pattern,
+    Callable,
+    Iterable,
+    Optional,
+    FrozenSet,
+)
+
+from nonebot.utils import escape_tag
+
+from .utils import log
+from .api.model import ChatType
+from .event import MessageEvent
+from .message import MessageSegment
+
+if TYPE_CHECKING:
+    from .bot import Bot
+
+
+@dataclass
+class Scan:
+    """对消息元素进行一次扫描得到的结果"""
+
+    types: Set[int]
+    """消息中出现的元素类型"""
+    reply: bool = False
+    """是否含有回复元素"""
+    at_me: bool = False
+    """是否含有 @机器人"""
+    nickname: bool = False
+    """是否有文本元素以机器人的昵称开头"""
+
+
+Stage = Callable[["Bot", MessageEvent, Scan], None]
+
+_stages: List[Tuple[Stage, Optional[FrozenSet[int]]]] = []
+
+
+def register_preprocessor(
+    stage: Stage, element_types: Optional[Iterable[int]] = None
+) -> Stage:
+    """注册消息事件的预处理阶段
+
+    预处理阶段在内置的回复、@机器人、昵称检查之后依次执行，
+    接收 Bot、消息事件与对消息元素的扫描结果，
+    可以修改 `event.message` 与 `event.to_me`。
+
+    参数:
+        stage: 预处理函数
+        element_types: 只在消息含有这些类型的元素时执行，默认总是执行
+
+    用法:
+        ```python
+        @register_preprocessor
+        def strip_prefix(bot: Bot, event: MessageEvent, scan: Scan) -> None:
+            ...
+        ```
+    """
+    types = frozenset(element_types) if element_types is not None else None
+    _stages.append((stage, types))
+    return stage
+
+
+@lru_cache(maxsize=16)
+def compile_nickname(nicknames: FrozenSet[str]) -> Optional[Pattern[str]]:
+    """编译匹配消息开头昵称的正则表达式，没有昵称时返回 `None`"""
+    if not nicknames:
+        return None
+    nickname_regex = "|".join(re.escape(n) for n in nicknames)
+    return re.compile(rf"^({nickname_regex})([\s,，]*|$)", re.IGNORECASE)
+
+
+class Preprocessor:
+    """bot 的消息事件预处理流程
+
+    昵称的正则表达式只在构造时编译一次；处理事件时先扫描一遍消息元素，
+    各个阶段依据扫描结果决定是否需要构建并修改消息。
+
+    参数:
+        self_id: bot 的 id
+        nicknames: 机器人的昵称
+    """
+
+    def __init__(self, self_id: str, nicknames: Iterable[str]) -> None:
+        self.self_id = str(self_id)
+        self.nickname = compile_nickname(frozenset(nicknames))
+
+    def scan(self, event: MessageEvent) -> Scan:
+        """扫描一遍消息元素"""
+        result = Scan(set())
+        for element in event.elements:
+            result.types.add(element.elementType)
+            if element.elementType == 7:
+                result.reply = True
+            elif element.elementType == 1 and (text := element.textElement):
+                if text.atType == 2:
+                    if str(text.atNtUin or text.atNtUid) == self.self_id:
+                        result.at_me = True
+                elif (
+                    not text.atType
+                    and self.nickname
+                    and not result.nickname
+                    and self.nickname.search(text.content.lstrip())
+                ):
+                    result.nickname = True
+        return result
+
+    def __call__(self, bot: "Bot", event: MessageEvent) -> None:
+        scan = self.scan(event)
+        if scan.reply:
+            self.check_reply(event)
+        self.check_to_me(event, scan)
+        if scan.nickname:
+            self.check_nickname(event)
+        for stage, types in _stages:
+            if types is not None and types.isdisjoint(scan.types):
+                continue
+            try:
+                stage(bot, event, scan)
+            except Exception as e:
+                log("ERROR", f"Error in preprocessor {escape_tag(repr(stage))}", e)
+
+    def _is_at_me_seg(self, segment: MessageSegment) -> bool:
+        return segment.type == "at" and str(segment.data.get("user_id", "")) == (
+            self.self_id
+        )
+
+    def check_reply(self, event: MessageEvent) -> None:
+        """检查消息中存在的回复，去除并赋值 `event.reply`, `event.to_me`。"""
+        try:
+            index = event.message.index("reply")
+        except ValueError:
+            return
+
+        msg_seg = event.message[index]
+
+        event.reply = msg_seg.data["_origin"]  # type: ignore
+
+        # ensure string comparation
+        if (
+            str(event.reply.senderUin) == self.self_id
+            or str(event.reply.senderUid) == self.self_id
+        ):
+            event.to_me = True
+
+        del event.message[index]
+        if len(event.message) > index and event.message[index].type == "at":
+            del event.message[index]
+        if len(event.message) > index and event.message[index].type == "text":
+            text = event.message[index].data["text"].lstrip()
+            if text:
+                event.message[index] = MessageSegment.text(text)
+            else:
+                del event.message[index]
+        if not event.message:
+            event.message.append(MessageSegment.text(""))
+
+    def check_to_me(self, event: MessageEvent, scan: Scan) -> None:
+        """检查消息开头或结尾是否存在 @机器人，去除并赋值 `event.to_me`。"""
+        if event.chatType == ChatType.FRIEND:
+            event.to_me = True
+            return
+
+        # 不含 @机器人 时无需构建消息
+        if not scan.at_me:
+            return
+
+        # check the first segment
+        if self._is_at_me_seg(event.message[0]):
+            event.to_me = True
+            event.message.pop(0)
+            if event.message and event.message[0].type == "text":
+                text = event.message[0].data["text"].lstrip()
+                if text:
+                    event.message[0] = MessageSegment.text(text)
+                else:
+                    del event.message[0]
+
+        if not event.to_me and event.message:
+            # check the last segment
+            i = -1
+            last_msg_seg = event.message[i]
+            if (
+                last_msg_seg.type == "text"
+                and not last_msg_seg.data["text"].strip()
+                and len(event.message) >= 2
+            ):
+                i -= 1
+                last_msg_seg = event.message[i]
+
+            if self._is_at_me_seg(last_msg_seg):
+                event.to_me = True
+                del event.message[i:]
+
+        if not event.message:
+            event.message.append(MessageSegment.text(""))
+
+    def check_nickname(self, event: MessageEvent) -> None:
+        """检查消息开头是否存在昵称，去除并赋值 `event.to_me`。"""
+        if not self.nickname:
+            return
+
+        first_msg_seg = event.message[0]
+        if first_msg_seg.type != "text":
+            return
+
+        first_text = first_msg_seg.data["text"]
+        if m := self.nickname.search(first_text):
+            log("DEBUG", f"User is calling me {m[1]}")
+            event.to_me = True
+            event.message[0] = MessageSegment.text(first_text[m.end() :])
@@ -0,0 +1,305 @@
+import time
+import asyncio
+from typing import (
+    Any,
+    Dict,
+    List,
+    Union,
+    TypeVar,
+    Callable,
+    Hashable,
+    Optional,
+    Awaitable,
+)
+
+from pydantic import BaseModel
+
+from .compat import model_copy
+from .api.model import Group, Member, Profile
+from .event import Event, MemberAddEvent, MemberMuteEvent, GroupNameUpdateEvent
+
+M = TypeVar("M", bound=BaseModel)
+
+
+def _copy(items: List[M]) -> List[M]:
+    # 资料的字段均为不可变的值，浅拷贝即可与缓存隔离
+    return [model_copy(item) for item in items]
+
+
+class _Members:
+    def __init__(self, size: int, items: List[Member]) -> None:
+        self.size = size
+        self.items = items
+        self.stored_at = time.monotonic()
+        self.index: Dict[str, Member] = {}
+        for member in items:
+            self.index[member.uid] = member
+            self.index[member.uin] = member
+
+
+class Roster:
+    """bot 的好友、群组与群成员资料缓存
+
+    `get_*` 开头的方法读取缓存，过期或不存在时调用传入的函数重新获取，
+    同一资料的并发获取只会发出一次请求；
+    `friend`、`group`、`member` 只查询缓存，不会发出请求，得到的资料可能已经过期。
+    返回的资料均为缓存的副本，修改它们不会影响缓存。
+    收到群成员变动、禁言、群名变更等事件时会更新对应的缓存。
+
+    参数:
+        ttl: 缓存的有效时间，单位为秒，为 0 时每次都重新获取
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._friends: Optional[List[Profile]] = None
+        self._friends_at = 0.0
+        self._friend_index: Dict[str, Profile] = {}
+        self._groups: Optional[List[Group]] = None
+        self._groups_at = 0.0
+        self._group_index: Dict[str, Group] = {}
+        self._members: Dict[str, _Members] = {}
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    def _fresh(self, stored_at: float) -> bool:
+        return time.monotonic() - stored_at < self.ttl
+
+    async def _once(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        if (task := self._inflight.get(key)) is None:
+            task = self._inflight[key] = asyncio.create_task(load())  # type: ignore
+
+            def _done(t: asyncio.Task) -> None:
+                if self._inflight.get(key) is t:
+                    del self._inflight[key]
+                if not t.cancelled():
+                    t.exception()
+
+            task.add_done_callback(_done)
+        return await asyncio.shield(task)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._friends = self._groups = None
+        self._friend_index.clear()
+        self._group_index.clear()
+        self._members.clear()
+
+    def invalidate(self, group: Union[int, str]) -> None:
+        """移除群组的成员资料缓存，例如群成员已经变动"""
+        self._members.pop(str(group), None)
+
+    def _member(
+        self, group: Union[int, str], user_id: Union[int, str]
+    ) -> Optional[Member]:
+        if (members := self._members.get(str(group))) is None:
+            return None
+        return members.index.get(str(user_id))
+
+    def friend(self, user_id: Union[int, str]) -> Optional[Profile]:
+        """依据 uin 或 uid 查询缓存中的好友资料"""
+        friend = self._friend_index.get(str(user_id))
+        return friend and model_copy(friend)
+
+    def group(self, group: Union[int, str]) -> Optional[Group]:
+        """依据群号查询缓存中的群组资料"""
+        info = self._group_index.get(str(group))
+        return info and model_copy(info)
+
+    def member(
+        self, group: Union[int, str], user_id: Union[int, str]
+    ) -> Optional[Member]:
+        """依据群号与 uin 或 uid 查询缓存中的群成员资料"""
+        member = self._member(group, user_id)
+        return member and model_copy(member)
+
+    def display_name(
+        self, user_id: Union[int, str], group: Union[int, str, None] = None
+    ) -> Optional[str]:
+        """查询缓存中用户的显示名称
+
+        提供群号时优先使用群名片，其次为好友备注与昵称
+
+        参数:
+            user_id: 用户的 uin 或 uid
+            group: 群号
+        """
+        if group is not None and (member := self._member(group, user_id)):
+            return member.cardName or member.nick
+        if friend := self._friend_index.get(str(user_id)):
+            return friend.remark or friend.nick
+        return None
+
+    def cached_members(
+        self, group: Union[int, str], size: int
+    ) -> Optional[List[Member]]:
+        """缓存未过期且数量足够时返回缓存的前 `size` 个群成员资料"""
+        members = self._members.get(str(group))
+        if members is None or members.size < size or not self._fresh(members.stored_at):
+            return None
+        return _copy(members.items[:size])
+
+    async def get_friends(
+        self, fetch: Callable[[], Awaitable[List[Profile]]], refresh: bool = False
+    ) -> List[Profile]:
+        """获取好友资料
+
+        参数:
+            fetch: 缓存不可用时获取资料的函数
+            refresh: 是否忽略缓存
+        """
+        return _copy(await self._load_friends(fetch, refresh))
+
+    async def get_friend(
+        self,
+        user_id: Union[int, str],
+        fetch: Callable[[], Awaitable[List[Profile]]],
+        refresh: bool = False,
+    ) -> Optional[Profile]:
+        """获取指定好友的资料，不是好友时返回 `None`
+
+        参数:
+            user_id: 好友的 uin 或 uid
+            fetch: 缓存不可用时获取资料的函数
+            refresh: 是否忽略缓存
+        """
+        await self._load_friends(fetch, refresh)
+        return self.friend(user_id)
+
+    async def _load_friends(
+        self, fetch: Callable[[], Awaitable[List[Profile]]], refresh: bool
+    ) -> List[Profile]:
+        if not refresh and self._friends is not None and self._fresh(self._friends_at):
+            return self._friends
+
+        async def _load() -> List[Profile]:
+            friends = await fetch()
+            self._friends, self._friends_at = friends, time.monotonic()
+            self._friend_index = {}
+            for friend in friends:
+                self._friend_index[friend.uid] = friend
+                self._friend_index[friend.uin] = friend
+            return friends
+
+        return await self._once("friends", _load)
+
+    async def get_groups(
+        self, fetch: Callable[[], Awaitable[List[Group]]], refresh: bool = False
+    ) -> List[Group]:
+        """获取群组资料
+
+        参数:
+            fetch: 缓存不可用时获取资料的函数
+            refresh: 是否忽略缓存
+        """
+        return _copy(await self._load_groups(fetch, refresh))
+
+    async def get_group(
+        self,
+        group: Union[int, str],
+        fetch: Callable[[], Awaitable[List[Group]]],
+        refresh: bool = False,
+    ) -> Optional[Group]:
+        """获取指定群组的资料，未加入该群组时返回 `None`
+
+        参数:
+            group: 群号
+            fetch: 缓存不可用时获取资料的函数
+            refresh: 是否忽略缓存
+        """
+        await self._load_groups(fetch, refresh)
+        return self.group(group)
+
+    async def _load_groups(
+        self, fetch: Callable[[], Awaitable[List[Group]]], refresh: bool
+    ) -> List[Group]:
+        if not refresh and self._groups is not None and self._fresh(self._groups_at):
+            return self._groups
+
+        async def _load() -> List[Group]:
+            groups = await fetch()
+            self._groups, self._groups_at = groups, time.monotonic()
+            self._group_index = {group.groupCode: group for group in groups}
+            return groups
+
+        return await self._once("groups", _load)
+
+    async def get_members(
+        self,
+        group: Union[int, str],
+        size: int,
+        fetch: Callable[[int], Awaitable[List[Member]]],
+        refresh: bool = False,
+    ) -> List[Member]:
+        """获取群成员资料
+
+        已缓存的成员数量不少于 `size` 时直接返回缓存的前 `size` 个成员
+
+        参数:
+            group: 群号
+            size: 拉取多少个成员资料
+            fetch: 缓存不可用时获取资料的函数，接收拉取的数量
+            refresh: 是否忽略缓存
+        """
+        return _copy(await self._load_members(group, size, fetch, refresh))
+
+    async def get_member(
+        self,
+        group: Union[int, str],
+        user_id: Union[int, str],
+        size: int,
+        fetch: Callable[[int], Awaitable[List[Member]]],
+        refresh: bool = False,
+    ) -> Optional[Member]:
+        """获取群组内指定成员的资料，不在群组内时返回 `None`
+
+        参数:
+            group: 群号
+            user_id: 成员的 uin 或 uid
+            size: 缓存不可用时拉取多少个成员资料
+            fetch: 缓存不可用时获取资料的函数，接收拉取的数量
+            refresh: 是否忽略缓存
+        """
+        await self._load_members(group, size, fetch, refresh)
+        return self.member(group, user_id)
+
+    async def _load_members(
+        self,
+        group: Union[int, str],
+        size: int,
+        fetch: Callable[[int], Awaitable[List[Member]]],
+        refresh: bool,
+    ) -> List[Member]:
+        group = str(group)
+        members = self._members.get(group)
+        if (
+            not refresh
+            and members is not None
+            and members.size >= size
+            and self._fresh(members.stored_at)
+        ):
+            return members.items[:size]
+
+        async def _load() -> List[Member]:
+            items = await fetch(size)
+            self._members[group] = _Members(size, items)
+            return items
+
+        return await self._once(("members", group, size), _load)
+
+    def apply(self, event: Event) -> None:
+        """依据收到的事件更新缓存"""
+        if isinstance(event, GroupNameUpdateEvent):
+            if group := self._group_index.get(event.scene):
+                group.groupName = event.currentName
+        elif isinstance(event, MemberAddEvent):
+            # 新成员的资料需要重新获取
+            self._members.pop(event.scene, None)
+            if group := self._group_index.get(event.scene):
+                group.memberCount += 1
+        elif isinstance(event, MemberMuteEvent):
+            target = event.member
+            if member := self._member(event.scene, target.uin or target.uid):
+                end = event.start + event.duration
+                member.shutUpTime = (
+                    int(end.timestamp()) if event.duration.total_seconds() >= 1 else 0
+                )
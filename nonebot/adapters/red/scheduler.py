@@ -0,0 +1,194 @@
+import time
+import asyncio
+from collections import deque
+from typing import Any, Dict, List, Deque, Tuple, Callable, Optional, Awaitable
+
+from nonebot.exception import NetworkError
+
+# 空闲会话的数量超过该值时清理已经回满的令牌桶
+PRUNE_THRESHOLD = 1024
+
+
+class TokenBucket:
+    """令牌桶
+
+    参数:
+        rate: 每秒补充的令牌数
+        burst: 令牌桶的容量，即允许的突发数量
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """距离下一个令牌可用还需等待的秒数"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        """取出一个令牌"""
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        """令牌桶是否已经回满"""
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class _Item:
+    __slots__ = ("call", "future", "queued_at")
+
+    def __init__(
+        self, call: Callable[[], Awaitable[Any]], future: asyncio.Future
+    ) -> None:
+        self.call = call
+        self.future = future
+        self.queued_at = time.monotonic()
+
+
+class _Peer:
+    def __init__(self, bucket: Optional[TokenBucket]) -> None:
+        self.bucket = bucket
+        self.items: Deque[_Item] = deque()
+        self.worker: Optional[asyncio.Task] = None
+
+
+class SendScheduler:
+    """bot 的消息发送调度器
+
+    每个聊天对象拥有独立的先进先出队列，同一对象的消息依次发送，前一条发送完成后才发送下一条；
+    发送前需要同时从全局、聊天类型与聊天对象三级令牌桶中各取得一个令牌，未配置速率的层级不做限制。
+
+    参数:
+        rate: 全局每秒发送的消息数量上限
+        chat_rates: 每种聊天类型每秒发送的消息数量上限
+        peer_rate: 每个聊天对象每秒发送的消息数量上限
+        burst: 令牌桶的容量，即允许的突发数量
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        chat_rates: Optional[Dict[int, Optional[float]]] = None,
+        peer_rate: Optional[float] = None,
+        burst: int = 5,
+    ) -> None:
+        self.burst = burst
+        self.peer_rate = peer_rate
+        self._global = TokenBucket(rate, burst) if rate else None
+        self._chat = {
+            int(chat_type): TokenBucket(chat_rate, burst)
+            for chat_type, chat_rate in (chat_rates or {}).items()
+            if chat_rate
+        }
+        self._peers: Dict[Tuple[int, str], _Peer] = {}
+        self.sent = 0
+        """已经发送的消息数量"""
+        self.wait_total = 0.0
+        """所有消息排队等待的总时间，单位为秒"""
+        self.wait_max = 0.0
+        """单条消息排队等待的最长时间，单位为秒"""
+
+    def depth(self, chat_type: Optional[int] = None, peer: Optional[str] = None) -> int:
+        """等待发送的消息数量，提供聊天对象时只计算该对象的队列"""
+        if chat_type is not None and peer is not None:
+            state = self._peers.get((int(chat_type), str(peer)))
+            return len(state.items) if state else 0
+        return sum(len(state.items) for state in self._peers.values())
+
+    def metrics(self) -> Dict[str, float]:
+        """发送队列的统计数据"""
+        return {
+            "queued": self.depth(),
+            "peers": sum(bool(state.items) for state in self._peers.values()),
+            "sent": self.sent,
+            "wait_avg": self.wait_total / self.sent if self.sent else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+    def submit(
+        self, chat_type: int, peer: str, call: Callable[[], Awaitable[Any]]
+    ) -> asyncio.Future:
+        """将发送操作加入对应聊天对象的队列，返回的 Future 在发送完成后得到结果
+
+        参数:
+            chat_type: 聊天类型
+            peer: 聊天对象 id
+            call: 执行发送的函数
+        """
+        key = (int(chat_type), str(peer))
+        if (state := self._peers.get(key)) is None:
+            if len(self._peers) >= PRUNE_THRESHOLD:
+                self._prune()
+            bucket = TokenBucket(self.peer_rate, self.burst) if self.peer_rate else None
+            state = self._peers[key] = _Peer(bucket)
+        future = asyncio.get_running_loop().create_future()
+        state.items.append(_Item(call, future))
+        if state.worker is None or state.worker.done():
+            state.worker = asyncio.create_task(self._work(key[0], state))
+        return future
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for key, state in list(self._peers.items()):
+            if not state.items and (state.bucket is None or state.bucket.full(now)):
+                del self._peers[key]
+
+    async def _acquire(self, chat_type: int, bucket: Optional[TokenBucket]) -> None:
+        buckets: List[TokenBucket] = [
+            b for b in (self._global, self._chat.get(chat_type), bucket) if b
+        ]
+        while True:
+            now = time.monotonic()
+            delay = max((b.delay(now) for b in buckets), default=0.0)
+            if delay <= 0:
+                for b in buckets:
+                    b.take()
+                return
+            await asyncio.sleep(delay)
+
+    async def _work(self, chat_type: int, state: _Peer) -> None:
+        while state.items:
+            if state.items[0].future.done():
+                # 调用者已经取消
+                state.items.popleft()
+                continue
+            await self._acquire(chat_type, state.bucket)
+            item = state.items.popleft()
+            if item.future.done():
+                continue
+            wait = time.monotonic() - item.queued_at
+            self.sent += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            try:
+                result = await item.call()
+            except asyncio.CancelledError:
+                # 发送途中调度器被关闭，正在发送的消息同样以 `NetworkError` 失败
+                if not item.future.done():
+                    item.future.set_exception(NetworkError("Bot disconnected"))
+                raise
+            except Exception as e:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            else:
+                if not item.future.done():
+                    item.future.set_result(result)
+
+    def close(self) -> None:
+        """停止发送，尚未发送的消息以 `NetworkError` 失败"""
+        for state in self._peers.values():
+            if state.worker is not None:
+                state.worker.cancel()
+            while state.items:
+                item = state.items.popleft()
+                if not item.future.done():
+                    item.future.set_exception(NetworkError("Bot disconnected"))
+        self._peers.clear()
@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import signal
+import asyncio
+import secrets
+from typing import Any, Set, Dict, List, Callable, Optional, Sequence
+
+from .utils import log
+
+# 主进程通过环境变量告知工作进程其分片序号与主进程的地址
+INDEX_ENV = "RED_SHARD_INDEX"
+HUB_ENV = "RED_SHARD_HUB"
+TOKEN_ENV = "RED_SHARD_TOKEN"
+
+Handler = Callable[[Dict[str, Any]], None]
+
+
+def shard_index() -> Optional[int]:
+    """当前进程的分片序号，主进程返回 `None`"""
+    index = os.environ.get(INDEX_ENV)
+    return int(index) if index is not None else None
+
+
+def shard_items(items: Sequence[Any], index: int, count: int) -> List[Any]:
+    """取出分配给第 `index` 个分片的项"""
+    return list(items[index::count])
+
+
+def _command() -> List[str]:
+    # `orig_argv` 保留了 `-m` 等解释器参数
+    argv = getattr(sys, "orig_argv", None)
+    return [sys.executable, *(argv[1:] if argv else sys.argv)]
+
+
+class _Channel:
+    """以换行分隔的 JSON 消息在进程间广播状态变更"""
+
+    def __init__(self, handler: Handler) -> None:
+        self.handler = handler
+        self._writers: Set[asyncio.StreamWriter] = set()
+
+    def publish(self, message: Dict[str, Any]) -> None:
+        """将消息发送给其他分片"""
+        self._send(message, None)
+
+    def _send(
+        self, message: Dict[str, Any], source: Optional[asyncio.StreamWriter]
+    ) -> None:
+        line = json.dumps(message).encode() + b"\n"
+        for writer in self._writers:
+            if writer is not source and not writer.is_closing():
+                writer.write(line)
+
+    async def _read(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        while line := await reader.readline():
+            try:
+                message = json.loads(line)
+                self.handler(message)
+            except Exception as e:
+                log("WARNING", "Failed to handle shard message", e)
+                continue
+            self._relay(message, writer)
+
+    def _relay(self, message: Dict[str, Any], source: asyncio.StreamWriter) -> None:
+        pass
+
+    async def close(self) -> None:
+        for writer in self._writers:
+            writer.close()
+        self._writers.clear()
+
+
+class Supervisor(_Channel):
+    """分片模式下的主进程
+
+    以相同的命令行启动 `count - 1` 个工作进程，主进程自身作为第 0 个分片；
+    主进程在本机监听一个端口，转发各个分片的状态变更。工作进程意外退出时会被重新启动。
+
+    参数:
+        count: 分片数量
+        handler: 处理其他分片发来的消息的函数
+    """
+
+    def __init__(self, count: int, handler: Handler) -> None:
+        super().__init__(handler)
+        self.count = count
+        self.token = secrets.token_hex(16)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._workers: List[asyncio.Task] = []
+        self._closing = False
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._accept, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        env = {**os.environ, HUB_ENV: f"127.0.0.1:{port}", TOKEN_ENV: self.token}
+        for index in range(1, self.count):
+            self._workers.append(
+                asyncio.create_task(self._run({**env, INDEX_ENV: str(index)}, index))
+            )
+
+    async def _run(self, env: Dict[str, str], index: int) -> None:
+        while not self._closing:
+            proc = await asyncio.create_subprocess_exec(*_command(), env=env)
+            log("INFO", f"Started shard {index} (pid {proc.pid})")
+            try:
+                code = await proc.wait()
+            except asyncio.CancelledError:
+                if proc.returncode is None:
+                    proc.terminate()
+                    await proc.wait()
+                raise
+            if self._closing:
+                return
+            log("ERROR", f"Shard {index} exited with code {code}, restarting...")
+            await asyncio.sleep(3)
+
+    async def _accept(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        if (await reader.readline()).strip() != self.token.encode():
+            writer.close()
+            return
+        self._writers.add(writer)
+        try:
+            await self._read(reader, writer)
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _relay(self, message: Dict[str, Any], source: asyncio.StreamWriter) -> None:
+        self._send(message, source)
+
+    async def close(self) -> None:
+        self._closing = True
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        if self._server is not None:
+            self._server.close()
+        await super().close()
+
+
+class ShardLink(_Channel):
+    """分片模式下的工作进程与主进程之间的连接
+
+    参数:
+        handler: 处理其他分片发来的消息的函数
+    """
+
+    def __init__(self, handler: Handler) -> None:
+        super().__init__(handler)
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        host, port = os.environ[HUB_ENV].rsplit(":", 1)
+        reader, writer = await asyncio.open_connection(host, int(port))
+        writer.write(os.environ[TOKEN_ENV].encode() + b"\n")
+        self._writers.add(writer)
+        self._task = asyncio.create_task(self._watch(reader, writer))
+
+    async def _watch(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        await self._read(reader, writer)
+        # 主进程已经退出，停止当前进程，避免与重新启动的分片重复连接
+        log("WARNING", "Lost connection to shard supervisor, shutting down...")
+        signal.raise_signal(signal.SIGTERM)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        await super().close()
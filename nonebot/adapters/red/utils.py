@@ -1,3 +1,49 @@
+import re
+import json
+import codecs
+from typing import Any, AsyncIterable, AsyncGenerator
+
 from nonebot.utils import logger_wrapper
 
 log = logger_wrapper("RedProtocol")
+
+_separator = re.compile(r"[\s,]*")
+
+
+async def iter_json_array(chunks: AsyncIterable[bytes]) -> AsyncGenerator[Any, None]:
+    """逐块解析 JSON 数组，每解析出一个元素就立即返回，不会保留整个数组
+
+    参数:
+        chunks: 数组的 JSON 字节流
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    started = False
+    async for chunk in chunks:
+        buffer += text.decode(chunk)
+        pos = 0
+        while True:
+            pos = _separator.match(buffer, pos).end()  # type: ignore
+            if pos >= len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # 元素尚未接收完整
+                break
+            if end >= len(buffer):
+                # 位于末尾的数字可能被截断，等待下一块数据
+                break
+            yield item
+            pos = end
+        buffer = buffer[pos:]
+    raise ValueError("Unexpected end of JSON array")